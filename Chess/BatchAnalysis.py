@@ -0,0 +1,215 @@
+# headless analysis of PGN game collections
+# games are streamed from the file one at a time, replayed through GameState and every position is
+# written out as one JSONL line or CSV row
+# run from the repository root: python Chess/BatchAnalysis.py games.pgn -o positions.jsonl
+# check the PGN reader on built-in samples: python Chess/BatchAnalysis.py --check
+import argparse
+import csv
+import gzip
+import json
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from ChessEngine import GameState, Move, START_FEN
+from BitboardEngine import BACKENDS, DEFAULT_BACKEND
+from ChessSearch import Searcher
+
+FIELDS = ["game", "ply", "fen", "move", "uci", "legalMoves", "inCheck", "checkmate", "stalemate", "score", "depth"]
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+HEADER = re.compile(r'\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+# comments, rest-of-line comments and numeric annotation glyphs carry no moves
+NON_MOVES = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+")
+MOVE_NUMBER = re.compile(r"^\d+\.+")
+SAN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$")
+# (PGN text, number of positions it replays to) run by --check, comments and variations spread over several lines
+CHECK_GAMES = [
+    ('[Event "rest of line comment"]\n\n1. e4 e5 ; note\n2. Nf3 Nc6 3. Bb5 a6 1-0\n', 7),
+    ('[Event "comment and variation over lines"]\n\n1. d4 {a comment\nover two lines} d5 2. c4 (2. Nf3\nNf6) e6 *\n', 5),
+    ('1. e4 c5 2. Nf3 d6 3. d4 cxd4 4. Nxd4 Nf6\n5. Nc3 a6 1/2-1/2\n', 11),
+]
+
+# yields (headers, movetext) for every game, reading the file line by line
+def readPgn(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as pgnFile:
+        yield from parsePgnLines(pgnFile)
+
+# yields (headers, movetext) for every game in an iterable of PGN lines
+# movetext keeps its line breaks, a ; comment only runs to the end of its own line
+def parsePgnLines(lines):
+    headers = {}
+    movetext = []
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            if movetext: # a header after moves starts the next game
+                yield headers, "\n".join(movetext)
+                headers = {}
+                movetext = []
+            match = HEADER.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line and not line.startswith("%"):
+            movetext.append(line)
+    if headers or movetext:
+        yield headers, "\n".join(movetext)
+
+# the SAN moves of a game's movetext, without numbers, comments, variations or the result
+def sanMoves(movetext):
+    text = NON_MOVES.sub(" ", movetext)
+    while "(" in text: # variations can nest, remove the innermost ones first
+        stripped = re.sub(r"\([^()]*\)", " ", text)
+        if stripped == text: # unbalanced parenthesis
+            break
+        text = stripped
+    sans = []
+    for token in text.split():
+        token = MOVE_NUMBER.sub("", token)
+        if token and token not in RESULTS:
+            sans.append(token)
+    return sans
+
+# find the valid move a SAN string describes
+def sanToMove(san, validMoves):
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        kingside = len(san) == 3
+        for move in validMoves:
+            if move.isCastleMove and (move.endCol > move.startCol) == kingside:
+                return move
+        raise ValueError("castling is not valid here: " + san)
+    match = SAN.match(san)
+    if match is None:
+        raise ValueError("not a SAN move: " + san)
+    piece, fromFile, fromRank, target, promotion = match.groups()
+    if promotion is not None and promotion != "Q":
+        raise ValueError("only promotion to a queen is supported: " + san)
+    piece = piece or "P"
+    endRow = Move.ranksToRows[target[1]]
+    endCol = Move.filesToCols[target[0]]
+    candidates = []
+    for move in validMoves:
+        if move.endRow == endRow and move.endCol == endCol and move.pieceMoved[1] == piece and \
+                (fromFile is None or move.startCol == Move.filesToCols[fromFile]) and \
+                (fromRank is None or move.startRow == Move.ranksToRows[fromRank]):
+            candidates.append(move)
+    if len(candidates) != 1:
+        raise ValueError(("ambiguous" if candidates else "illegal") + " move: " + san)
+    return candidates[0]
+
+# replay one game and return a record for every position in it, the position after the last move included
+def analyzeGame(gameIndex, headers, movetext, backend=GameState, searchDepth=0, searchTime=1.0, searcher=None):
+    gs = backend.fromFen(headers["FEN"]) if "FEN" in headers else backend.fromFen(START_FEN)
+    if searchDepth and searcher is None:
+        searcher = Searcher()
+    sans = sanMoves(movetext)
+    records = []
+    for ply in range(len(sans) + 1):
+        validMoves = gs.getValidMoves()
+        record = {"game": gameIndex, "ply": ply, "fen": gs.toFen(), "move": None, "uci": None,
+                  "legalMoves": len(validMoves), "inCheck": gs.inCheck(),
+                  "checkmate": gs.checkmate, "stalemate": gs.stalemate, "score": None, "depth": None}
+        if searchDepth and validMoves:
+            iterations = searcher.iterativeDeepening(gs, validMoves, searchTime, searchDepth)
+            if iterations:
+                record["depth"], record["score"] = iterations[-1][0], iterations[-1][1]
+        records.append(record)
+        if ply == len(sans):
+            break
+        move = sanToMove(sans[ply], validMoves)
+        record["move"] = sans[ply]
+        record["uci"] = move.getChessNotation()
+        gs.makeMove(move)
+    return records
+
+# worker: analyze one game, returning the error instead of raising so one bad game does not stop the run
+def analyzeGameSafely(gameIndex, headers, movetext, backend, searchDepth, searchTime):
+    try:
+        return analyzeGame(gameIndex, headers, movetext, backend, searchDepth, searchTime), None
+    except ValueError as error:
+        return [], "game " + str(gameIndex) + ": " + str(error)
+
+# yields (records, error) for every game in the file
+# with an executor the games are analyzed in parallel, with at most a few games per worker in flight
+def analyzeGames(path, backend=GameState, searchDepth=0, searchTime=1.0, executor=None, workers=1):
+    games = enumerate(readPgn(path))
+    if executor is None:
+        for gameIndex, (headers, movetext) in games:
+            yield analyzeGameSafely(gameIndex, headers, movetext, backend, searchDepth, searchTime)
+        return
+    pending = deque()
+    for gameIndex, (headers, movetext) in games:
+        pending.append(executor.submit(analyzeGameSafely, gameIndex, headers, movetext, backend, searchDepth, searchTime))
+        if len(pending) >= workers * 4:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# write the records of every game as JSONL or CSV, returns (games, positions, errors)
+def writeRecords(results, output, outputFormat="jsonl"):
+    games = positions = errors = 0
+    writer = None
+    if outputFormat == "csv":
+        writer = csv.DictWriter(output, fieldnames=FIELDS)
+        writer.writeheader()
+    for records, error in results:
+        games += 1
+        if error is not None:
+            errors += 1
+            print(error, file=sys.stderr)
+            continue
+        for record in records:
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                output.write(json.dumps(record, separators=(",", ":")) + "\n")
+        positions += len(records)
+    return games, positions, errors
+
+# replay the CHECK_GAMES samples and compare the number of positions, returns True if they all match
+def runCheck(backend=GameState):
+    passed = True
+    for pgn, expected in CHECK_GAMES:
+        for headers, movetext in parsePgnLines(pgn.splitlines()):
+            positions = len(analyzeGame(0, headers, movetext, backend))
+            if positions != expected:
+                passed = False
+                print("MISMATCH %d positions, expected %d: %r" % (positions, expected, pgn), file=sys.stderr)
+    print("%d sample games checked" % len(CHECK_GAMES), file=sys.stderr)
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze every position of a PGN collection without a GUI")
+    parser.add_argument("pgn", nargs="?", help="PGN file, optionally gzip compressed")
+    parser.add_argument("-o", "--output", help="output file, standard output by default")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--search-depth", type=int, default=0, help="search every position to this depth, 0 to skip")
+    parser.add_argument("--search-time", type=float, default=1.0, help="time limit per searched position in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--check", action="store_true", help="replay the built-in sample games instead of a file")
+    args = parser.parse_args()
+    backend = BACKENDS[args.backend]
+    if args.check:
+        if not runCheck(backend):
+            sys.exit(1)
+        return
+    if args.pgn is None:
+        parser.error("a PGN file is needed unless --check is given")
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.workers > 1:
+            with ProcessPoolExecutor(args.workers) as executor:
+                counts = writeRecords(analyzeGames(args.pgn, backend, args.search_depth, args.search_time,
+                                                   executor, args.workers), output, args.format)
+        else:
+            counts = writeRecords(analyzeGames(args.pgn, backend, args.search_depth, args.search_time),
+                                  output, args.format)
+    finally:
+        if args.output:
+            output.close()
+    print("%d games, %d positions, %d games skipped" % counts, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# scores many positions in one go with NumPy, for labelling position datasets
+# positions are encoded as an (N, 12, 8, 8) one-hot tensor with one plane per GameState piece code,
+# then material, piece-square tables (the same ones Evaluation.py uses) and mobility are summed with array operations
+# run from the repository root: python Chess/BatchEvaluation.py positions.fen -o scores.txt
+import argparse
+import sys
+import numpy as np
+from ChessEngine import PIECE_LETTERS
+from Evaluation import MG_SCORES, EG_SCORES, PHASE_WEIGHTS, MAX_PHASE
+import Epd
+
+PIECE_CODES = ["wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK"] # tensor plane order
+# centipawns per square a kind of piece attacks that is not taken by its own side
+MOBILITY_WEIGHTS = {"N": 4, "B": 5, "R": 2, "Q": 1}
+
+# snapshot letter -> plane index, 12 for an empty square
+LETTER_PLANES = np.full(256, 12, dtype=np.uint8)
+for plane, piece in enumerate(PIECE_CODES):
+    LETTER_PLANES[ord(PIECE_LETTERS[piece])] = plane
+MG_WEIGHTS = np.array([MG_SCORES[piece] for piece in PIECE_CODES], dtype=np.int64).reshape(12, 8, 8)
+EG_WEIGHTS = np.array([EG_SCORES[piece] for piece in PIECE_CODES], dtype=np.int64).reshape(12, 8, 8)
+PHASE_PLANES = np.array([PHASE_WEIGHTS[piece] for piece in PIECE_CODES], dtype=np.int64)
+FEN_DIGITS = {str(n): "." * n for n in range(1, 9)}
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+ORTHOGONAL_STEPS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL_STEPS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+# mobility works on bitboards, one uint64 per position and plane with bit r * 8 + c set for an occupied square
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+COLUMN_MASKS = {dc: np.uint64(sum(1 << (r * 8 + c) for r in range(8) for c in range(8) if 0 <= c - dc < 8))
+                for dc in range(-2, 3)} # squares a shift by dc columns can land on without wrapping
+
+# 64 snapshot letters for a GameState or a FEN string, row 0 (the 8th rank) first
+def boardLetters(position):
+    if isinstance(position, str):
+        board = position.split(None, 1)[0]
+        for digit, empty in FEN_DIGITS.items():
+            board = board.replace(digit, empty)
+        return board.replace("/", "")
+    return "".join([PIECE_LETTERS[square] for row in position.board for square in row])
+
+def whiteToMove(position):
+    if isinstance(position, str):
+        fields = position.split()
+        return len(fields) < 2 or fields[1] == "w"
+    return position.whiteToMove
+
+# one-hot (N, 12, 8, 8) uint8 tensor of the positions, plus the (N,) side to move (True for white)
+def encodePositions(positions):
+    letters = "".join([boardLetters(position) for position in positions])
+    if len(letters) != 64 * len(positions):
+        raise ValueError("every position needs 64 squares")
+    planes = LETTER_PLANES[np.frombuffer(letters.encode("ascii"), dtype=np.uint8)].reshape(-1, 1, 8, 8)
+    tensor = (planes == np.arange(12, dtype=np.uint8).reshape(1, 12, 1, 1)).astype(np.uint8)
+    sideToMove = np.array([whiteToMove(position) for position in positions], dtype=bool)
+    return tensor, sideToMove
+
+# (N, 12) uint64 bitboards of an encoded batch
+def tensorBitboards(tensor):
+    return np.packbits(tensor.reshape(tensor.shape[0], 12, 64), axis=2, bitorder="little").view("<u8")[:, :, 0]
+
+def popcount(bitboards):
+    return POPCOUNT[bitboards.view(np.uint8)].reshape(bitboards.shape[0], 8).sum(axis=1)
+
+# bitboards moved by (dr, dc), squares pushed off the board are dropped
+def shift(bitboards, dr, dc):
+    amount = dr * 8 + dc
+    moved = bitboards << np.uint64(amount) if amount > 0 else bitboards >> np.uint64(-amount)
+    return moved & COLUMN_MASKS[dc]
+
+# squares attacked by the pieces of one bitboard per position, sliding on through empty squares if slides is set
+def attacks(pieces, steps, slides, empty):
+    attacked = np.zeros_like(pieces)
+    for dr, dc in steps:
+        reach = shift(pieces, dr, dc)
+        attacked |= reach
+        if slides:
+            for i in range(6):
+                reach = shift(reach & empty, dr, dc)
+                attacked |= reach
+    return attacked
+
+# mobility score from white's point of view: the squares each kind of piece attacks that are not taken by its own side
+def scoreMobility(tensor):
+    bitboards = tensorBitboards(tensor)
+    white = np.bitwise_or.reduce(bitboards[:, :6], axis=1)
+    black = np.bitwise_or.reduce(bitboards[:, 6:], axis=1)
+    empty = ~(white | black)
+    score = np.zeros(tensor.shape[0], dtype=np.int64)
+    for offset, sign, own in ((0, 1, white), (6, -1, black)):
+        for plane, steps, slides in ((1, KNIGHT_STEPS, False), (2, DIAGONAL_STEPS, True),
+                                     (3, ORTHOGONAL_STEPS, True), (4, ORTHOGONAL_STEPS + DIAGONAL_STEPS, True)):
+            attacked = attacks(bitboards[:, offset + plane], steps, slides, empty) & ~own
+            score += sign * MOBILITY_WEIGHTS[PIECE_CODES[plane][1]] * popcount(attacked)
+    return score
+
+# scores of an encoded batch from the side to move's point of view
+# without mobility the result equals Evaluation.evaluate for every position
+def scoreTensor(tensor, sideToMove, mobility=True):
+    mg = np.tensordot(tensor, MG_WEIGHTS, axes=([1, 2, 3], [0, 1, 2]))
+    eg = np.tensordot(tensor, EG_WEIGHTS, axes=([1, 2, 3], [0, 1, 2]))
+    phase = np.minimum(tensor.sum(axis=(2, 3), dtype=np.int64) @ PHASE_PLANES, MAX_PHASE)
+    score = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+    if mobility:
+        score += scoreMobility(tensor)
+    return np.where(sideToMove, score, -score)
+
+# scores of GameStates and / or FEN strings from the side to move's point of view, as an (N,) int64 array
+def scorePositions(positions, mobility=True):
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.int64)
+    tensor, sideToMove = encodePositions(positions)
+    return scoreTensor(tensor, sideToMove, mobility)
+
+# FEN strings of a file of FEN or EPD lines
+def readPositions(path):
+    with open(path) as positionFile:
+        for line in positionFile:
+            line = line.strip()
+            if line and line[0] != "#":
+                yield Epd.parseEpdLine(line)[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a file of FEN or EPD positions in batches")
+    parser.add_argument("positions", help="one FEN or EPD position per line")
+    parser.add_argument("-o", "--output", help="output file, standard output by default")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    parser.add_argument("--no-mobility", action="store_true", help="material and piece-square tables only")
+    args = parser.parse_args()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        batch = []
+        for fen in readPositions(args.positions):
+            batch.append(fen)
+            if len(batch) == args.batch_size:
+                writeScores(batch, output, not args.no_mobility)
+                batch = []
+        writeScores(batch, output, not args.no_mobility)
+    finally:
+        if args.output:
+            output.close()
+
+def writeScores(fens, output, mobility):
+    for fen, score in zip(fens, scorePositions(fens, mobility).tolist()):
+        output.write(fen + " " + str(score) + "\n")
+
+if __name__ == "__main__":
+    main()
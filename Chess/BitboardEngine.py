@@ -0,0 +1,353 @@
+# bitboard backend for GameState
+# every square is a bit: square index = row * 8 + col, so a1 is bit 56 and h8 is bit 7
+import os
+import pickle
+from ChessEngine import GameState, Move, MoveList, ALL_MOVES, CAPTURES, QUIETS
+
+PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+ROW_3 = 0xFF << 40 # white pawns land here after a single push
+ROW_6 = 0xFF << 16 # black pawns land here after a single push
+ROW_8 = 0xFF # white pawns promote here
+ROW_1 = 0xFF << 56 # black pawns promote here
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)] # (row, col) of every square index, shared by all moves
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KING_STEPS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+# builds a table of 64 bitboards from a list of (row, col) offsets
+def stepTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+# builds the ray of every square in a direction, the square itself excluded
+def rayTable(d):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for i in range(1, 8):
+            endRow = r + d[0] * i
+            endCol = c + d[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            bb |= 1 << (endRow * 8 + endCol)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = stepTable(KNIGHT_JUMPS)
+KING_ATTACKS = stepTable(KING_STEPS)
+# squares a pawn of the given color attacks from each square
+PAWN_ATTACKS = {"w": stepTable(((-1, -1), (-1, 1))), "b": stepTable(((1, -1), (1, 1)))}
+# (ray table, True if the ray runs towards higher square indexes)
+ROOK_RAYS = [(rayTable(d), d[0] > 0 or (d[0] == 0 and d[1] > 0)) for d in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(rayTable(d), d[0] > 0) for d in BISHOP_DIRECTIONS]
+
+# attacks of a slider along the given rays, stopping at the first blocker
+# only used to fill the lookup tables below
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+# the squares whose occupancy can change a slider's attacks: its rays without the board edge
+def relevantMask(sq, rays):
+    mask = 0
+    for table, positive in rays:
+        ray = table[sq]
+        if ray:
+            edge = 1 << (ray.bit_length() - 1) if positive else ray & -ray # farthest square of the ray
+            mask |= ray ^ edge
+    return mask
+
+# for every square, a dict from relevant occupancy to attack set, built by walking every blocker subset
+def buildAttackTable(masks, rays):
+    table = []
+    for sq in range(64):
+        mask = masks[sq]
+        attacks = {}
+        subset = 0
+        while True:
+            attacks[subset] = slidingAttacks(sq, subset, rays)
+            subset = (subset - mask) & mask # next subset of the mask
+            if subset == 0:
+                break
+        table.append(attacks)
+    return table
+
+# slider tables are loaded from a pickle next to this file, or built and saved there the first time
+ATTACK_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attack_tables.pickle")
+ATTACK_TABLE_VERSION = 1
+
+def loadAttackTables():
+    try:
+        with open(ATTACK_TABLE_FILE, "rb") as tableFile:
+            version, rookTable, bishopTable = pickle.load(tableFile)
+        if version == ATTACK_TABLE_VERSION:
+            return rookTable, bishopTable
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    rookTable = buildAttackTable(ROOK_MASKS, ROOK_RAYS)
+    bishopTable = buildAttackTable(BISHOP_MASKS, BISHOP_RAYS)
+    try:
+        temporaryFile = ATTACK_TABLE_FILE + "." + str(os.getpid())
+        with open(temporaryFile, "wb") as tableFile:
+            pickle.dump((ATTACK_TABLE_VERSION, rookTable, bishopTable), tableFile, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporaryFile, ATTACK_TABLE_FILE) # other processes never see a half written file
+    except OSError: # read-only install, build the tables again next time
+        pass
+    return rookTable, bishopTable
+
+ROOK_MASKS = [relevantMask(sq, ROOK_RAYS) for sq in range(64)]
+BISHOP_MASKS = [relevantMask(sq, BISHOP_RAYS) for sq in range(64)]
+ROOK_ATTACKS, BISHOP_ATTACKS = loadAttackTables()
+
+# BETWEEN[a][b]: the squares strictly between a and b if they share a rank, file or diagonal, else 0
+BETWEEN = [[0] * 64 for sq in range(64)]
+for d in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        between = 0
+        for i in range(1, 8):
+            endRow = r + d[0] * i
+            endCol = c + d[1] * i
+            if not (0 <= endRow < 8 and 0 <= endCol < 8):
+                break
+            BETWEEN[sq][endRow * 8 + endCol] = between
+            between |= 1 << (endRow * 8 + endCol)
+
+def rookAttacks(sq, occupied):
+    return ROOK_ATTACKS[sq][occupied & ROOK_MASKS[sq]]
+
+def bishopAttacks(sq, occupied):
+    return BISHOP_ATTACKS[sq][occupied & BISHOP_MASKS[sq]]
+
+# GameState that keeps twelve piece bitboards next to the string board
+# the string board is still maintained so Move and the drawing code keep working
+class BitboardGameState(GameState):
+    def __init__(self):
+        super().__init__()
+        self.syncBitboards()
+
+    def loadPosition(self, board, whiteToMove, castleRights, enpassantPossible, halfmoveClock=0, fullmoveNumber=1):
+        super().loadPosition(board, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber)
+        self.syncBitboards()
+
+    # rebuild the bitboards from the string board
+    def syncBitboards(self):
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {"w": 0, "b": 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= 1 << (r * 8 + c)
+                    self.occupancy[piece[0]] |= 1 << (r * 8 + c)
+
+    def makeMove(self, move):
+        super().makeMove(move)
+        self.toggleMove(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            super().undoMove()
+            self.toggleMove(move)
+
+    # flip the bits a move changes, applying it twice restores the bitboards
+    def toggleMove(self, move):
+        color = move.pieceMoved[0]
+        start = 1 << (move.startRow * 8 + move.startCol)
+        end = 1 << (move.endRow * 8 + move.endCol)
+        self.bitboards[move.pieceMoved] ^= start
+        self.bitboards[color + "Q" if move.isPawnPromotion else move.pieceMoved] ^= end
+        self.occupancy[color] ^= start | end
+        if move.pieceCaptured != "--":
+            captured = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantMove else end
+            self.bitboards[move.pieceCaptured] ^= captured
+            self.occupancy[move.pieceCaptured[0]] ^= captured
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # kingside
+                rook = (1 << (move.endRow * 8 + 7)) | (1 << (move.endRow * 8 + 5))
+            else: # queenside
+                rook = (1 << (move.endRow * 8)) | (1 << (move.endRow * 8 + 3))
+            self.bitboards[color + "R"] ^= rook
+            self.occupancy[color] ^= rook
+
+    # check if pieces of color enemy attack square sq
+    # occupied and removed let the caller ask about a position after a move without making it
+    def isAttacked(self, sq, enemy, occupied, removed=0):
+        bb = self.bitboards
+        if KNIGHT_ATTACKS[sq] & bb[enemy + "N"] & ~removed:
+            return True
+        if PAWN_ATTACKS["b" if enemy == "w" else "w"][sq] & bb[enemy + "P"] & ~removed:
+            return True
+        if KING_ATTACKS[sq] & bb[enemy + "K"]:
+            return True
+        queens = bb[enemy + "Q"]
+        if rookAttacks(sq, occupied) & (bb[enemy + "R"] | queens) & ~removed:
+            return True
+        if bishopAttacks(sq, occupied) & (bb[enemy + "B"] | queens) & ~removed:
+            return True
+        return False
+
+    def squareUnderAttack(self, r, c):
+        enemy = "b" if self.whiteToMove else "w"
+        return self.isAttacked(r * 8 + c, enemy, self.occupancy["w"] | self.occupancy["b"])
+
+    # valid moves with checks, found like the mailbox backend does: the checks and pins on the king
+    # are worked out once, then other pieces only need their target square masked
+    # king moves and en passant are tested on the bitboards of the position after the move
+    def getValidMoves(self, moves=None, kind=ALL_MOVES):
+        if moves is None:
+            moves = MoveList()
+        else:
+            moves.clear()
+        bb = self.bitboards
+        ally = "w" if self.whiteToMove else "b"
+        enemy = "b" if self.whiteToMove else "w"
+        kingSq = bb[ally + "K"].bit_length() - 1
+        own = self.occupancy[ally]
+        occupied = own | self.occupancy[enemy]
+        rooks = bb[enemy + "R"] | bb[enemy + "Q"]
+        bishops = bb[enemy + "B"] | bb[enemy + "Q"]
+        checkers = (KNIGHT_ATTACKS[kingSq] & bb[enemy + "N"]) | (PAWN_ATTACKS[ally][kingSq] & bb[enemy + "P"]) | \
+                   (rookAttacks(kingSq, occupied) & rooks) | (bishopAttacks(kingSq, occupied) & bishops)
+        if checkers == 0:
+            evasions = FULL
+        elif checkers & (checkers - 1) == 0: # capture the checker or block its line
+            evasions = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+        else: # double check, only the king can move
+            evasions = 0
+        # pinned square -> squares it may move to, between the king and the pinning piece or onto that piece
+        pins = {}
+        snipers = (ROOK_ATTACKS[kingSq][0] & rooks) | (BISHOP_ATTACKS[kingSq][0] & bishops)
+        while snipers:
+            sniper = snipers & -snipers
+            snipers ^= sniper
+            sniperSq = sniper.bit_length() - 1
+            blockers = BETWEEN[kingSq][sniperSq] & occupied
+            if blockers & own and blockers & (blockers - 1) == 0: # exactly one piece in between and it is ours
+                pins[blockers.bit_length() - 1] = BETWEEN[kingSq][sniperSq] | sniper
+        for move in self.getAllPossibleMoves(self.pseudoMoves, kind):
+            endSq = move.endRow * 8 + move.endCol
+            if move.pieceMoved[1] == "K" or move.isEnpassantMove:
+                start = 1 << (move.startRow * 8 + move.startCol)
+                end = 1 << endSq
+                removed = 1 << (move.startRow * 8 + move.endCol) if move.isEnpassantMove else end
+                after = (occupied & ~start & ~removed) | end
+                target = endSq if move.pieceMoved[1] == "K" else kingSq
+                if not self.isAttacked(target, enemy, after, removed):
+                    moves.append(move)
+            elif evasions >> endSq & 1:
+                if pins:
+                    pin = pins.get(move.startRow * 8 + move.startCol)
+                    if pin is not None and not pin >> endSq & 1:
+                        continue
+                moves.append(move)
+        if kind != CAPTURES:
+            self.getCastleMoves(kingSq // 8, kingSq % 8, moves)
+        if kind == ALL_MOVES:
+            self.setGameEndFlags(len(moves) != 0, len(moves) == 0 and self.inCheck())
+        return moves
+
+    # valid moves without checks
+    def getAllPossibleMoves(self, moves=None, kind=ALL_MOVES):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        bb = self.bitboards
+        board = self.board
+        white = self.whiteToMove
+        ally = "w" if white else "b"
+        own = self.occupancy[ally]
+        enemies = self.occupancy["b" if white else "w"]
+        empty = ~(own | enemies) & FULL
+        # pawns: shift the whole set at once, then walk the target squares
+        pawns = bb[ally + "P"]
+        # promotions go with the captures when kind splits the moves
+        if white:
+            singles = (pawns >> 8) & empty
+            doubles = ((singles & ROW_3) >> 8) & empty
+            promotions = ROW_8
+            pawnTargets = [(((pawns & ~FILE_A) >> 9) & enemies, 9), (((pawns & ~FILE_H) >> 7) & enemies, 7)]
+        else:
+            singles = (pawns << 8) & empty
+            doubles = ((singles & ROW_6) << 8) & empty
+            promotions = ROW_1
+            pawnTargets = [(((pawns & ~FILE_A) << 7) & enemies, -7), (((pawns & ~FILE_H) << 9) & enemies, -9)]
+        if kind == CAPTURES:
+            pawnTargets.append((singles & promotions, 8 if white else -8))
+        elif kind == QUIETS:
+            pawnTargets = [(singles & ~promotions, 8 if white else -8), (doubles, 16 if white else -16)]
+        else:
+            pawnTargets += [(singles, 8 if white else -8), (doubles, 16 if white else -16)]
+        for targets, offset in pawnTargets:
+            while targets:
+                lsb = targets & -targets
+                end = lsb.bit_length() - 1
+                moves.append(Move(SQUARES[end + offset], SQUARES[end], board))
+                targets ^= lsb
+        if self.enpassantPossible != () and kind != QUIETS:
+            epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+            attackers = PAWN_ATTACKS["b" if white else "w"][epSq] & pawns
+            while attackers:
+                lsb = attackers & -attackers
+                moves.append(Move(SQUARES[lsb.bit_length() - 1], self.enpassantPossible, board, isEnpassantMove=True))
+                attackers ^= lsb
+        # pieces: look up the attack set and drop squares held by our own pieces
+        occupied = own | enemies
+        for pieceType in "NBRQK":
+            pieces = bb[ally + pieceType]
+            while pieces:
+                lsb = pieces & -pieces
+                start = lsb.bit_length() - 1
+                pieces ^= lsb
+                if pieceType == "N":
+                    targets = KNIGHT_ATTACKS[start]
+                elif pieceType == "B":
+                    targets = bishopAttacks(start, occupied)
+                elif pieceType == "R":
+                    targets = rookAttacks(start, occupied)
+                elif pieceType == "Q":
+                    targets = rookAttacks(start, occupied) | bishopAttacks(start, occupied)
+                else:
+                    targets = KING_ATTACKS[start]
+                targets &= ~own
+                if kind == CAPTURES:
+                    targets &= enemies
+                elif kind == QUIETS:
+                    targets &= empty
+                startSq = SQUARES[start]
+                while targets:
+                    t = targets & -targets
+                    moves.append(Move(startSq, SQUARES[t.bit_length() - 1], board))
+                    targets ^= t
+        return moves
+
+# the backends by name, for the --backend options of the tools
+# mailbox is the default: keeping the bitboards next to the string board makes makeMove and undoMove
+# slower, which eats what the bitboard move generator gains, see python Chess/Perft.py --backend all
+BACKENDS = {"mailbox": GameState, "bitboard": BitboardGameState}
+DEFAULT_BACKEND = "mailbox"
@@ -0,0 +1,842 @@
+import random
+from Evaluation import MG_SCORES, EG_SCORES, PHASE_WEIGHTS, scoreBoard
+
+# zobrist keys, seeded so a position has the same key in every process
+zobristRandom = random.Random(20211)
+ZOBRIST_PIECES = {piece: [zobristRandom.getrandbits(64) for sq in range(64)]
+                  for piece in ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")}
+ZOBRIST_BLACK_TO_MOVE = zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [zobristRandom.getrandbits(64) for i in range(16)] # one key per castleRights.index()
+ZOBRIST_ENPASSANT = [zobristRandom.getrandbits(64) for col in range(8)] # one key per file
+
+# precomputed targets for every square, so attack scans need no bounds checks
+# RAYS[r][c][j] lists the squares in direction DIRECTIONS[j] from r, c, nearest first
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)) # orthogonal then diagonal
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+RAYS = [[tuple(tuple((r + d[0] * i, c + d[1] * i) for i in range(1, 8)
+                     if 0 <= r + d[0] * i < 8 and 0 <= c + d[1] * i < 8) for d in DIRECTIONS)
+         for c in range(8)] for r in range(8)]
+ORTHOGONAL_RAYS = [[RAYS[r][c][:4] for c in range(8)] for r in range(8)]
+DIAGONAL_RAYS = [[RAYS[r][c][4:] for c in range(8)] for r in range(8)]
+KNIGHT_TARGETS = [[tuple((r + m[0], c + m[1]) for m in KNIGHT_JUMPS if 0 <= r + m[0] < 8 and 0 <= c + m[1] < 8)
+                   for c in range(8)] for r in range(8)]
+KING_TARGETS = [[tuple((r + d[0], c + d[1]) for d in DIRECTIONS if 0 <= r + d[0] < 8 and 0 <= c + d[1] < 8)
+                 for c in range(8)] for r in range(8)]
+# directions, seen from the attacked square, in which an enemy pawn one square away attacks it
+PAWN_ATTACK_DIRECTIONS = {"w": (6, 7), "b": (4, 5)}
+
+# undo records store the en passant square as r * 8 + c + 1, or 0 for none
+ENPASSANT_SQUARES = [()] + [(r, c) for r in range(8) for c in range(8)]
+
+# one character per square for snapshots, white pieces in upper case
+PIECE_LETTERS = {"--": ".", "wP": "P", "wN": "N", "wB": "B", "wR": "R", "wQ": "Q", "wK": "K",
+                 "bP": "p", "bN": "n", "bB": "b", "bR": "r", "bQ": "q", "bK": "k"}
+LETTER_PIECES = {v: k for k, v in PIECE_LETTERS.items()}
+# which moves getValidMoves generates, captures include en passant and promotions
+ALL_MOVES = 0
+CAPTURES = 1
+QUIETS = 2
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# parsed FEN ranks, the same few rank strings come up again and again in large position files
+# emptied when it reaches FEN_RANKS_LIMIT entries so a long run of positions can't grow it without bound
+FEN_RANKS = {}
+FEN_RANKS_LIMIT = 10000
+# (castling right bit of CastleRights.index(), king home square, rook home square, color)
+CASTLING_HOMES = ((1, (7, 4), (7, 7), "w"), (2, (0, 4), (0, 7), "b"), (4, (7, 4), (7, 0), "w"), (8, (0, 4), (0, 0), "b"))
+
+# stores information of the current GameState
+class GameState():
+    def __init__(self):
+        self.board = [
+            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["--", "--", "--", "--", "--", "--", "--", "--"],
+            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
+            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
+        self.setUp()
+        self.whiteToMove = True
+        self.moveLog = []
+        self.whiteKingLocation = (7, 4)
+        self.blackKingLocation = (0, 4)
+        self.checkmate = False
+        self.stalemate = False
+        self.draw = False # threefold repetition or fifty move rule, the side to move still has moves
+        self.enpassantPossible = () # coordinate of where enpessant is possible
+        self.halfmoveClock = 0 # moves since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1
+        # zobrist key from before every move in moveLog, plus any keys inherited by copy()
+        # makeMove pushes and undoMove pops it, repetitions are looked up here
+        self.keyHistory = []
+        self.zobristKey = self.computeZobristKey()
+        self.mgScore, self.egScore, self.phase = scoreBoard(self.board) # evaluation terms, see Evaluation.py
+
+    # what a game state needs whatever its position, loadPosition fills in the rest
+    def setUp(self):
+        self.moveFunctions = {"P": self.getPawnMoves, "R": self.getRookMoves, "N": self.getKnightMoves,
+                              "B": self.getBishopMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
+        self.pseudoMoves = [] # scratch list getValidMoves refills with pseudo-legal moves
+        self.currentCastlingRights = CastleRights(True, True, True, True) # changed in place, never replaced
+        # one packed record per move in moveLog with the state undoMove restores, see pushUndoRecord
+        # preallocated and grown by doubling, so making a move allocates no undo objects
+        self.undoStack = [0] * 256
+
+    # a game state of this class without a position, for loadPosition to fill in
+    # skips setting up, hashing and scoring the start position the way cls() does
+    @classmethod
+    def withoutPosition(cls):
+        gs = cls.__new__(cls)
+        gs.setUp()
+        return gs
+
+    # set up an arbitrary position, the move history starts over from it
+    # castling rights whose king or rook is not on its home square are dropped
+    def loadPosition(self, board, whiteToMove, castleRights, enpassantPossible, halfmoveClock=0, fullmoveNumber=1):
+        self.board = [list(row) for row in board]
+        self.whiteToMove = whiteToMove
+        self.moveLog = []
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif self.board[r][c] == "bK":
+                    self.blackKingLocation = (r, c)
+        self.checkmate = False
+        self.stalemate = False
+        self.draw = False
+        self.enpassantPossible = enpassantPossible
+        castleIndex = castleRights.index()
+        for bit, (kingRow, kingCol), (rookRow, rookCol), color in CASTLING_HOMES:
+            if castleIndex & bit and (self.board[kingRow][kingCol] != color + "K" or
+                                      self.board[rookRow][rookCol] != color + "R"):
+                castleIndex ^= bit
+        self.currentCastlingRights.setIndex(castleIndex)
+        self.halfmoveClock = halfmoveClock
+        self.fullmoveNumber = fullmoveNumber
+        self.keyHistory = []
+        self.zobristKey = self.computeZobristKey()
+        self.mgScore, self.egScore, self.phase = scoreBoard(self.board) # evaluation terms, see Evaluation.py
+
+    # build a game state of this class from a FEN string
+    # raises ValueError for a malformed FEN or an impossible position (kings, pawns, en passant square)
+    @classmethod
+    def fromFen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        board = []
+        for rank in ranks:
+            row = FEN_RANKS.get(rank)
+            if row is None:
+                row = []
+                for letter in rank:
+                    if letter.isdigit():
+                        row.extend(["--"] * int(letter))
+                    elif letter in LETTER_PIECES:
+                        row.append(LETTER_PIECES[letter])
+                    else:
+                        raise ValueError("bad piece letter " + repr(letter) + " in FEN: " + fen)
+                if len(row) != 8:
+                    raise ValueError("FEN rank " + rank + " is not 8 squares long")
+                if len(FEN_RANKS) >= FEN_RANKS_LIMIT:
+                    FEN_RANKS.clear()
+                FEN_RANKS[rank] = row
+            board.append(row)
+        if fields[0].count("K") != 1 or fields[0].count("k") != 1:
+            raise ValueError("FEN needs one king of each color: " + fen)
+        if "P" in ranks[0] or "p" in ranks[0] or "P" in ranks[7] or "p" in ranks[7]:
+            raise ValueError("FEN has a pawn on the first or eighth rank: " + fen)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        whiteToMove = fields[1] == "w"
+        castling = fields[2]
+        if castling != "-" and (len(set(castling)) != len(castling) or not set(castling) <= set("KQkq")):
+            raise ValueError("bad castling field in FEN: " + fen)
+        castleRights = CastleRights("K" in castling, "k" in castling, "Q" in castling, "q" in castling)
+        enpassantPossible = ()
+        if fields[3] != "-":
+            square = fields[3]
+            if len(square) != 2 or square[0] not in Move.filesToCols or square[1] != ("6" if whiteToMove else "3"):
+                raise ValueError("bad en passant square in FEN: " + fen)
+            r, c = Move.ranksToRows[square[1]], Move.filesToCols[square[0]]
+            d = 1 if whiteToMove else -1 # from the en passant square towards the pawn that just moved two squares
+            if board[r][c] != "--" or board[r - d][c] != "--" or board[r + d][c] != ("bP" if whiteToMove else "wP"):
+                raise ValueError("no pawn just moved two squares past the en passant square in FEN: " + fen)
+            enpassantPossible = (r, c)
+        halfmoveClock = 0
+        if len(fields) > 4:
+            if not (fields[4].isascii() and fields[4].isdigit()):
+                raise ValueError("FEN halfmove clock must be a number of at least 0: " + fen)
+            halfmoveClock = int(fields[4])
+        fullmoveNumber = 1
+        if len(fields) > 5:
+            if not (fields[5].isascii() and fields[5].isdigit()) or int(fields[5]) < 1:
+                raise ValueError("FEN fullmove number must be a number of at least 1: " + fen)
+            fullmoveNumber = int(fields[5])
+        gs = cls.withoutPosition()
+        gs.loadPosition(board, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber)
+        return gs
+
+    # FEN string of the current position
+    def toFen(self):
+        return self.toEpd() + " " + str(self.halfmoveClock) + " " + str(self.fullmoveNumber)
+
+    # first four FEN fields followed by EPD operations such as {"bm": "e4", "id": "\"start\""}
+    def toEpd(self, operations=None):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += PIECE_LETTERS[square]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        rights = self.currentCastlingRights
+        castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+                   ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+        enpassant = "-"
+        if self.enpassantPossible != ():
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        epd = "/".join(ranks) + (" w " if self.whiteToMove else " b ") + (castling or "-") + " " + enpassant
+        if operations:
+            epd += "".join([" " + opcode + " " + str(operand) + ";" for opcode, operand in operations.items()])
+        return epd
+
+    # independent game state of the same class and position, without the move history
+    # the keys since the last capture or pawn move come along, so repetitions are still seen
+    # safe to hand to another thread while this one keeps changing
+    def copy(self):
+        gs = type(self).fromFen(self.toFen())
+        gs.keyHistory = self.recentKeys()
+        return gs
+
+    # the keys since the last capture or pawn move, all a repetition can match
+    def recentKeys(self):
+        return self.keyHistory[max(len(self.keyHistory) - self.halfmoveClock, 0):]
+
+    # compact picklable copy of the position, cheap to send to worker processes
+    # (64 square letters, whiteToMove, castling rights index, en passant square, halfmove clock, fullmove number,
+    # recentKeys() so repetitions are still seen)
+    def snapshot(self):
+        board = "".join([PIECE_LETTERS[square] for row in self.board for square in row])
+        return (board, self.whiteToMove, self.currentCastlingRights.index(), self.enpassantPossible,
+                self.halfmoveClock, self.fullmoveNumber, tuple(self.recentKeys()))
+
+    # build a game state of this class from snapshot()
+    @classmethod
+    def fromSnapshot(cls, snapshot):
+        letters, whiteToMove, castleIndex, enpassantPossible, halfmoveClock, fullmoveNumber, keys = snapshot
+        board = [[LETTER_PIECES[letter] for letter in letters[r * 8:r * 8 + 8]] for r in range(8)]
+        gs = cls.withoutPosition()
+        gs.loadPosition(board, whiteToMove, CastleRights.fromIndex(castleIndex), enpassantPossible,
+                        halfmoveClock, fullmoveNumber)
+        gs.keyHistory = list(keys)
+        return gs
+
+    # hash the whole position from scratch, makeMove and undoMove keep zobristKey up to date after this
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= ZOBRIST_CASTLING[self.currentCastlingRights.index()]
+        if self.enpassantPossible != ():
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        return key
+
+    # xor the pieces a move changes into the key, doing it twice restores the key
+    def hashMove(self, move):
+        color = move.pieceMoved[0]
+        key = self.zobristKey
+        key ^= ZOBRIST_PIECES[move.pieceMoved][move.startRow * 8 + move.startCol]
+        key ^= ZOBRIST_PIECES[color + "Q" if move.isPawnPromotion else move.pieceMoved][move.endRow * 8 + move.endCol]
+        if move.pieceCaptured != "--":
+            captureCol = move.endCol
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            key ^= ZOBRIST_PIECES[move.pieceCaptured][captureRow * 8 + captureCol]
+        if move.isCastleMove:
+            rookStart, rookEnd = (7, 5) if move.endCol - move.startCol == 2 else (0, 3)
+            key ^= ZOBRIST_PIECES[color + "R"][move.endRow * 8 + rookStart]
+            key ^= ZOBRIST_PIECES[color + "R"][move.endRow * 8 + rookEnd]
+        self.zobristKey = key ^ ZOBRIST_BLACK_TO_MOVE
+
+    # add what a move changes in the evaluation terms, sign -1 takes it back out
+    def updateScores(self, move, sign):
+        moved = move.pieceMoved
+        placed = moved[0] + "Q" if move.isPawnPromotion else moved
+        start = move.startRow * 8 + move.startCol
+        end = move.endRow * 8 + move.endCol
+        mg = MG_SCORES[placed][end] - MG_SCORES[moved][start]
+        eg = EG_SCORES[placed][end] - EG_SCORES[moved][start]
+        phase = PHASE_WEIGHTS[placed] - PHASE_WEIGHTS[moved]
+        if move.pieceCaptured != "--":
+            captured = move.startRow * 8 + move.endCol if move.isEnpassantMove else end
+            mg -= MG_SCORES[move.pieceCaptured][captured]
+            eg -= EG_SCORES[move.pieceCaptured][captured]
+            phase -= PHASE_WEIGHTS[move.pieceCaptured]
+        if move.isCastleMove:
+            rook = moved[0] + "R"
+            rookStart, rookEnd = (7, 5) if move.endCol - move.startCol == 2 else (0, 3)
+            rookStart += move.endRow * 8
+            rookEnd += move.endRow * 8
+            mg += MG_SCORES[rook][rookEnd] - MG_SCORES[rook][rookStart]
+            eg += EG_SCORES[rook][rookEnd] - EG_SCORES[rook][rookStart]
+        self.mgScore += sign * mg
+        self.egScore += sign * eg
+        self.phase += sign * phase
+
+    # save the castling rights, en passant square, zobrist key and halfmove clock from before the move
+    # the key goes on keyHistory, the rest is packed into one int:
+    # castling in bits 0-3, en passant in bits 4-10, clock above
+    def pushUndoRecord(self):
+        ply = len(self.moveLog)
+        if ply == len(self.undoStack):
+            self.undoStack.extend([0] * ply)
+        enpassant = self.enpassantPossible
+        self.undoStack[ply] = self.halfmoveClock << 11 | \
+            (enpassant[0] * 8 + enpassant[1] + 1 if enpassant != () else 0) << 4 | self.currentCastlingRights.index()
+        self.keyHistory.append(self.zobristKey)
+
+    # executes a move
+    def makeMove(self, move):
+        self.pushUndoRecord()
+        # take the pieces, side, old en passant file and old castling rights out of the key
+        self.hashMove(move)
+        self.updateScores(move, 1)
+        if self.enpassantPossible != ():
+            self.zobristKey ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        self.zobristKey ^= ZOBRIST_CASTLING[self.currentCastlingRights.index()]
+        self.board[move.startRow][move.startCol] = "--"
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        self.moveLog.append(move) # log the move for later
+        self.whiteToMove = not self.whiteToMove # switch players
+        # track location of kings
+        if move.pieceMoved == "wK":
+            self.whiteKingLocation = (move.endRow, move.endCol)
+        if move.pieceMoved == "bK":
+            self.blackKingLocation = (move.endRow, move.endCol)
+        # pawn promotion
+        if move.isPawnPromotion:
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+        # en passant
+        if move.isEnpassantMove: 
+            self.board[move.startRow][move.endCol] = "--"
+        if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
+            self.enpassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
+        else:
+            self.enpassantPossible = ()
+        if self.enpassantPossible != ():
+            self.zobristKey ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        # castle move
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # kingside castle
+                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] # move rook
+                self.board[move.endRow][move.endCol+1] = "--" # erase old rook
+            else: # queenside castle
+                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] # move rook
+                self.board[move.endRow][move.endCol-2] = "--" # erase old rook
+        # update castling rights 
+        self.updateCastleRights(move)
+        self.zobristKey ^= ZOBRIST_CASTLING[self.currentCastlingRights.index()]
+        # move counters
+        if move.pieceMoved[1] == "P" or move.pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.pieceMoved[0] == "b":
+            self.fullmoveNumber += 1
+   
+    # check if the current position occurred at least times times before
+    # only positions with the same side to move since the last capture or pawn move can repeat,
+    # so this looks at every other key of the last halfmoveClock plies and no further
+    def isRepetition(self, times=1):
+        keys = self.keyHistory
+        key = self.zobristKey
+        stop = len(keys) - self.halfmoveClock
+        i = len(keys) - 4 # the position two plies ago can't be the same, a move and its reply don't restore it
+        count = 0
+        while i >= stop and i >= 0:
+            if keys[i] == key:
+                count += 1
+                if count >= times:
+                    return True
+            i -= 2
+        return False
+
+    # check if the game is drawn by threefold repetition or the fifty move rule
+    def isDraw(self):
+        return self.halfmoveClock >= 100 or self.isRepetition(2)
+
+    # set the game end flags after generating all valid moves, checkmate and stalemate take precedence over a draw
+    def setGameEndFlags(self, hasMoves, inCheck):
+        self.checkmate = not hasMoves and inCheck
+        self.stalemate = not hasMoves and not inCheck
+        self.draw = hasMoves and self.isDraw()
+
+    # undo a move
+    def undoMove(self):
+        if len(self.moveLog) != 0: # check if there is a move to undo
+            move = self.moveLog.pop()
+            record = self.undoStack[len(self.moveLog)]
+            self.updateScores(move, -1)
+            self.board[move.startRow][move.startCol] = move.pieceMoved
+            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            self.whiteToMove = not self.whiteToMove # switch players
+            # track location of kings
+            if move.pieceMoved == "wK":
+                self.whiteKingLocation = (move.startRow, move.startCol)
+            if move.pieceMoved == "bK":
+                self.blackKingLocation = (move.startRow, move.startCol)
+            # undo en passant
+            if move.isEnpassantMove:
+                self.board[move.endRow][move.endCol] = "--"
+                self.board[move.startRow][move.endCol] = move.pieceCaptured
+            # restore en passant square, castling rights, key and halfmove clock from the undo record
+            self.currentCastlingRights.setIndex(record & 15)
+            self.enpassantPossible = ENPASSANT_SQUARES[record >> 4 & 127]
+            self.zobristKey = self.keyHistory.pop()
+            self.halfmoveClock = record >> 11
+            if move.pieceMoved[0] == "b":
+                self.fullmoveNumber -= 1
+            # undo castle move
+            if move.isCastleMove:
+                if move.endCol - move.startCol == 2: # kingside
+                    self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-1]
+                    self.board[move.endRow][move.endCol-1] = "--"
+                else: # queenside
+                    self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
+                    self.board[move.endRow][move.endCol+1] = "--"
+    
+    # update castle rights when a move is given
+    def updateCastleRights(self, move):
+        if move.pieceMoved == "wK":
+            self.currentCastlingRights.wks = False
+            self.currentCastlingRights.wqs = False
+        elif move.pieceMoved == "bK":
+            self.currentCastlingRights.bks = False
+            self.currentCastlingRights.bqs = False
+        elif move.pieceMoved == "wR":
+            if move.startRow == 7:
+                if move.startCol == 0: #left rook
+                    self.currentCastlingRights.wqs = False
+                elif move.startCol == 7: #right rook
+                    self.currentCastlingRights.wks = False
+        elif move.pieceMoved == "bR":
+            if move.startRow == 0:
+                if move.startCol == 0: #left rook
+                        self.currentCastlingRights.bqs = False
+                elif move.startCol == 7: #right rook
+                    self.currentCastlingRights.bks = False
+        if move.pieceCaptured == 'wR':
+            if move.endRow == 7:
+                if move.endCol == 0:
+                    self.currentCastlingRights.wqs = False
+                elif move.endCol == 7:
+                    self.currentCastlingRights.wks = False
+        elif move.pieceCaptured == 'bR':
+            if move.endRow == 0:
+                if move.endCol == 0:
+                    self.currentCastlingRights.bqs = False
+                elif move.endCol == 7:
+                    self.currentCastlingRights.bks = False
+
+    # valid moves with checks
+    # pins and checks are found once from the king's square, then every move is filtered directly
+    # pass a list as moves to have it cleared and refilled instead of allocating a new one
+    # kind CAPTURES or QUIETS generates only that part of the moves and leaves checkmate and stalemate alone
+    def getValidMoves(self, moves=None, kind=ALL_MOVES):
+        if moves is None:
+            moves = MoveList()
+        else:
+            moves.clear()
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        pinDirections = {(pin[0], pin[1]): (pin[2], pin[3]) for pin in pins}
+        validSquares = None # squares that block or capture a single checking piece
+        if len(checks) == 1:
+            checkRow, checkCol, dr, dc = checks[0]
+            validSquares = {(checkRow, checkCol)}
+            if self.board[checkRow][checkCol][1] != "N": # a slider can also be blocked
+                for i in range(1, 8):
+                    square = (kingRow + dr * i, kingCol + dc * i)
+                    if square == (checkRow, checkCol):
+                        break
+                    validSquares.add(square)
+        for move in self.getAllPossibleMoves(self.pseudoMoves, kind):
+            if move.pieceMoved[1] == "K":
+                if self.kingSafeAfter(move, move.endRow, move.endCol):
+                    moves.append(move)
+                continue
+            if len(checks) > 1: # double check, only the king can move
+                continue
+            if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                # en passant can remove a checking pawn without landing on its square
+                if not (move.isEnpassantMove and (move.startRow, move.endCol) == (checkRow, checkCol)):
+                    continue
+            pinDirection = pinDirections.get((move.startRow, move.startCol))
+            if pinDirection is not None:
+                if move.pieceMoved[1] == "N": # a pinned knight can never move
+                    continue
+                dr = (move.endRow > move.startRow) - (move.endRow < move.startRow)
+                dc = (move.endCol > move.startCol) - (move.endCol < move.startCol)
+                if pinDirection != (dr, dc) and pinDirection != (-dr, -dc): # must stay on the pin line
+                    continue
+            # en passant removes two pawns from one rank, which a pin on a single piece does not cover
+            if move.isEnpassantMove and not self.kingSafeAfter(move, kingRow, kingCol):
+                continue
+            moves.append(move)
+        if not inCheck and kind != CAPTURES:
+            self.getCastleMoves(kingRow, kingCol, moves)
+        if kind == ALL_MOVES:
+            self.setGameEndFlags(len(moves) != 0, inCheck)
+        return moves
+
+    # look outward from square r, c for enemy pieces that attack it
+    # returns if the square is attacked, the ally pieces pinned to it and the attacking pieces
+    # pins and checks are (row, col, direction row, direction col) with the direction seen from r, c
+    def checkForPinsAndChecks(self, r, c):
+        pins = []
+        checks = []
+        inCheck = False
+        allyColor = "w" if self.whiteToMove else "b"
+        enemyColor = "b" if self.whiteToMove else "w"
+        pawnDirections = PAWN_ATTACK_DIRECTIONS[enemyColor]
+        rays = RAYS[r][c]
+        for j in range(8):
+            d = DIRECTIONS[j]
+            possiblePin = () # reset possible pins
+            for i, (endRow, endCol) in enumerate(rays[j]):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == allyColor:
+                    if possiblePin == (): # first allied piece could be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else: # second allied piece, so no pin or check in this direction
+                        break
+                elif endPiece[0] == enemyColor:
+                    pieceType = endPiece[1]
+                    # 1. orthogonally away and the piece is a rook
+                    # 2. diagonally away and the piece is a bishop
+                    # 3. one square away diagonally and the piece is a pawn
+                    # 4. any direction and the piece is a queen
+                    # 5. any direction one square away and the piece is a king
+                    if (j <= 3 and pieceType == "R") or (j >= 4 and pieceType == "B") or \
+                            (i == 0 and pieceType == "P" and j in pawnDirections) or \
+                            (pieceType == "Q") or (i == 0 and pieceType == "K"):
+                        if possiblePin == (): # no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
+                        else: # piece blocking, so pin
+                            pins.append(possiblePin)
+                    break # enemy piece ends the ray either way
+        for endRow, endCol in KNIGHT_TARGETS[r][c]:
+            if self.board[endRow][endCol] == enemyColor + "N": # enemy knight attacking the square
+                inCheck = True
+                checks.append((endRow, endCol, endRow - r, endCol - c))
+        return inCheck, pins, checks
+
+    # put a move on the board without making it and check if the king on r, c is attacked
+    def kingSafeAfter(self, move, r, c):
+        self.board[move.startRow][move.startCol] = "--"
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        if move.isEnpassantMove:
+            self.board[move.startRow][move.endCol] = "--"
+        inCheck = self.checkForPinsAndChecks(r, c)[0]
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        if move.isEnpassantMove:
+            self.board[move.endRow][move.endCol] = "--"
+            self.board[move.startRow][move.endCol] = move.pieceCaptured
+        else:
+            self.board[move.endRow][move.endCol] = move.pieceCaptured
+        return not inCheck
+    
+    # the valid move with this moveID, or None, without generating the other pieces' moves
+    def getValidMove(self, moveID):
+        r = moveID // 10000
+        c = moveID // 100 % 10
+        piece = self.board[r][c]
+        if piece[0] != ("w" if self.whiteToMove else "b"):
+            return None
+        candidates = []
+        self.moveFunctions[piece[1]](r, c, candidates)
+        if piece[1] == "K":
+            self.getCastleMoves(r, c, candidates)
+        for move in candidates:
+            if move.moveID == moveID:
+                if move.isCastleMove: # castle moves are only generated when they are valid
+                    return move
+                if piece[1] == "K":
+                    return move if self.kingSafeAfter(move, move.endRow, move.endCol) else None
+                kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+                return move if self.kingSafeAfter(move, kingRow, kingCol) else None
+        return None
+
+    # check if the current player in check
+    def inCheck(self):
+        if self.whiteToMove:
+            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
+        else:
+            return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
+
+    # check if enemy can attack square r, c
+    # looks outward from the square along rays, knight jumps and pawn diagonals and stops at the first attacker
+    def squareUnderAttack(self, r, c):
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.board
+        for endRow, endCol in KNIGHT_TARGETS[r][c]:
+            if board[endRow][endCol] == enemyColor + "N":
+                return True
+        pawnDirections = PAWN_ATTACK_DIRECTIONS[enemyColor]
+        rays = RAYS[r][c]
+        for j in range(8):
+            for i, (endRow, endCol) in enumerate(rays[j]):
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == enemyColor:
+                    pieceType = endPiece[1]
+                    if pieceType == "Q" or (pieceType == "R" if j <= 3 else pieceType == "B"):
+                        return True
+                    if i == 0 and (pieceType == "K" or (pieceType == "P" and j in pawnDirections)):
+                        return True
+                break # the first piece blocks the ray
+        return False
+
+    # valid moves without checks
+    def getAllPossibleMoves(self, moves=None, kind=ALL_MOVES):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        for r in range(len(self.board)): # rows 
+            for c in range(len(self.board[r])): # columns in a row
+                turn = self.board[r][c][0]
+                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
+                    piece = self.board[r][c][1]
+                    self.moveFunctions[piece](r, c , moves, kind) # call move function for each type
+        return moves
+
+    # get all moves of every piece and add them to the list
+    # a push to the last rank counts as a capture for kind, like any other promotion
+    def getPawnMoves(self, r, c, moves, kind=ALL_MOVES):
+        if self.whiteToMove: # white moves
+            if self.board[r-1][c] == "--": # 1 square move
+                if kind == ALL_MOVES or (kind == CAPTURES) == (r-1 == 0):
+                    moves.append(Move((r, c), (r-1, c), self.board))
+                if r == 6 and kind != CAPTURES and self.board[r-2][c] == "--": # 2 square move
+                    moves.append(Move((r, c), (r-2, c), self.board))
+            if kind == QUIETS:
+                return
+            if c-1 >= 0: # capture left
+                if self.board[r-1][c-1][0] == "b": # if pawn can capture
+                    moves.append(Move((r, c), (r-1, c-1), self.board))
+                elif (r-1, c-1) == self.enpassantPossible:
+                    moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
+            if c+1 <= 7: # capture right
+                if self.board[r-1][c+1][0] == "b": # if pawn can capture
+                    moves.append(Move((r, c), (r-1, c+1), self.board))
+                elif (r-1, c+1) == self.enpassantPossible:
+                    moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
+        else: # black moves
+            if self.board[r+1][c] == "--": # 1 square move
+                if kind == ALL_MOVES or (kind == CAPTURES) == (r+1 == 7):
+                    moves.append(Move((r, c), (r+1, c), self.board))
+                if r == 1 and kind != CAPTURES and self.board[r+2][c] == "--": # 2 square move
+                    moves.append(Move((r, c), (r+2, c), self.board))
+            if kind == QUIETS:
+                return
+            if c-1 >= 0: # capture left
+                if self.board[r+1][c-1][0] == "w": # if pawn can capture
+                    moves.append(Move((r, c), (r+1, c-1), self.board))
+                elif (r+1, c-1) == self.enpassantPossible:
+                    moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
+            if c+1 <= 7: # capture right
+                if self.board[r+1][c+1][0] == "w": # if pawn can capture
+                    moves.append(Move((r, c), (r+1, c+1), self.board))
+                elif (r+1, c+1) == self.enpassantPossible:
+                    moves.append(Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
+
+    def getRookMoves(self, r, c, moves, kind=ALL_MOVES):
+        self.getSlidingMoves(r, c, ORTHOGONAL_RAYS[r][c], moves, kind)
+
+    def getKnightMoves(self, r, c, moves, kind=ALL_MOVES):
+        self.getStepMoves(r, c, KNIGHT_TARGETS[r][c], moves, kind)
+
+    def getBishopMoves(self, r, c, moves, kind=ALL_MOVES):
+        self.getSlidingMoves(r, c, DIAGONAL_RAYS[r][c], moves, kind)
+
+    def getQueenMoves(self, r, c, moves, kind=ALL_MOVES):
+        self.getSlidingMoves(r, c, RAYS[r][c], moves, kind)
+
+    def getKingMoves(self, r, c, moves, kind=ALL_MOVES):
+        self.getStepMoves(r, c, KING_TARGETS[r][c], moves, kind)
+
+    # moves of a knight or king to its precomputed target squares
+    def getStepMoves(self, r, c, targets, moves, kind):
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.board
+        for endRow, endCol in targets:
+            endPiece = board[endRow][endCol]
+            if endPiece == "--":
+                if kind != CAPTURES:
+                    moves.append(Move((r, c), (endRow, endCol), board))
+            elif endPiece[0] == enemyColor and kind != QUIETS:
+                moves.append(Move((r, c), (endRow, endCol), board))
+
+    # walk the precomputed rays of a rook, bishop or queen until a piece blocks them
+    def getSlidingMoves(self, r, c, rays, moves, kind=ALL_MOVES):
+        enemyColor = "b" if self.whiteToMove else "w"
+        board = self.board
+        for ray in rays:
+            for endRow, endCol in ray:
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    if kind != CAPTURES:
+                        moves.append(Move((r, c), (endRow, endCol), board))
+                elif endPiece[0] == enemyColor: # capture enemy piece
+                    if kind != QUIETS:
+                        moves.append(Move((r, c), (endRow, endCol), board))
+                    break
+                else: # friendly piece
+                    break
+
+    # get all valid castle moves
+    def getCastleMoves(self, r, c, moves):
+        if self.squareUnderAttack(r, c):
+            return # can't castle in check
+        if (self.whiteToMove and self.currentCastlingRights.wks) or (not self.whiteToMove and self.currentCastlingRights.bks):
+            self.getKingSideCastleMoves(r, c, moves)
+        if (self.whiteToMove and self.currentCastlingRights.wqs) or (not self.whiteToMove and self.currentCastlingRights.bqs):
+            self.getQueenSideCastleMoves(r, c , moves)
+    
+    def getKingSideCastleMoves(self, r, c, moves):
+        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
+            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
+                moves.append(Move((r, c), (r, c+2), self.board, isCastleMove=True))
+
+
+    def getQueenSideCastleMoves(self, r, c, moves):
+        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
+            if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
+                moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
+
+# the list getValidMoves returns, with lookups by moveID and by starting square
+# the lookup tables are built on first use, so move generation inside the search does not pay for them
+# don't add or remove moves after the first lookup
+class MoveList(list):
+    __slots__ = ("byID", "bySquare")
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.byID = None
+        self.bySquare = None
+
+    def buildIndex(self):
+        self.byID = {}
+        self.bySquare = {}
+        for move in self:
+            self.byID[move.moveID] = move
+            self.bySquare.setdefault((move.startRow, move.startCol), []).append(move)
+
+    # the valid move with this moveID, or None
+    def getMove(self, moveID):
+        if self.byID is None:
+            self.buildIndex()
+        return self.byID.get(moveID)
+
+    # the valid move from startSq to endSq as (row, col) tuples, or None
+    def findMove(self, startSq, endSq):
+        return self.getMove(startSq[0] * 10000 + startSq[1] * 100 + endSq[0] * 10 + endSq[1])
+
+    # the valid moves of the piece on (r, c)
+    def movesFrom(self, r, c):
+        if self.bySquare is None:
+            self.buildIndex()
+        return self.bySquare.get((r, c), [])
+
+class CastleRights():
+    def __init__(self, wks, bks, wqs, bqs):
+        self.wks = wks
+        self.bks = bks
+        self.wqs = wqs
+        self.bqs = bqs
+
+    # pack the four rights into a number from 0 to 15
+    def index(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
+    # set the four rights from index() in place
+    def setIndex(self, index):
+        self.wks = bool(index & 1)
+        self.bks = bool(index & 2)
+        self.wqs = bool(index & 4)
+        self.bqs = bool(index & 8)
+
+    @staticmethod
+    def fromIndex(index):
+        return CastleRights(bool(index & 1), bool(index & 2), bool(index & 4), bool(index & 8))
+
+# store all information about a particular move
+class Move():
+    # fixed attributes instead of a per instance __dict__, moves are created by the thousand
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured",
+                 "isPawnPromotion", "isEnpassantMove", "isCastleMove", "moveID")
+
+    # map keys to values
+    # key : value
+    ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
+                   "5": 3, "6": 2, "7": 1, "8": 0}
+    rowsToRanks = {v: k for k, v in ranksToRows.items()}
+    filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
+                   "e": 4, "f": 5, "g": 6, "h": 7}
+    colsToFiles = {v: k for k, v in filesToCols.items()}
+
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
+        self.startRow = startSq[0]
+        self.startCol = startSq[1]
+        self.endRow = endSq[0]
+        self.endCol = endSq[1]
+        self.pieceMoved = board[self.startRow][self.startCol]
+        self.pieceCaptured = board[self.endRow][self.endCol]
+        # pawn promotion
+        self.isPawnPromotion = (self.pieceMoved == "wP" and self.endRow == 0) or (self.pieceMoved == "bP" and self.endRow == 7)
+        # en passant
+        self.isEnpassantMove = isEnpassantMove
+        if self.isEnpassantMove:
+            self.pieceCaptured = "wP" if self.pieceMoved == "bP" else "bP"
+        # castle move
+        self.isCastleMove = isCastleMove
+        
+        self.moveID = self.startRow * 10000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+
+    # override equal notation
+    def __eq__(self, other):
+        if isinstance(other, Move):
+            return self.moveID == other.moveID
+        return False
+
+    def __hash__(self):
+        return self.moveID
+
+    def getChessNotation(self):
+        return self.getRankFiles(self.startRow, self.startCol) + self.getRankFiles(self.endRow, self.endCol)
+
+    def getRankFiles(self, r, c):
+        return self.colsToFiles[c] + self.rowsToRanks[r]
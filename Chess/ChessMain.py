@@ -1,395 +1,219 @@
-# stores information of the current GameState
-class GameState():
-    def __init__(self):
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
-        self.moveFunctions = {"P": self.getPawnMoves, "R": self.getRookMoves, "N": self.getKnightMoves,
-                              "B": self.getBishopMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
-        self.whiteToMove = True
-        self.moveLog = []
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
-        self.checkmate = False
-        self.stalemate = False
-        self.enpassantPossible = () # coordinate of where enpessant is possible
-        self.currentCastlingRights = CastleRights(True, True, True, True)
-        self.castleRightsLogs = [CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, 
-                                              self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)]
-
-    # executes a move
-    def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMoved
-        self.moveLog.append(move) # log the move for later
-        self.whiteToMove = not self.whiteToMove # switch players
-        # track location of kings
-        if move.pieceMoved == "wK":
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        if move.pieceMoved == "bK":
-            self.blackKingLocation = (move.endRow, move.endCol)
-        # pawn promotion
-        if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
-        # en passant
-        if move.isEnpassantMove: 
-            self.board[move.startRow][move.endCol] = "--"
-        if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-            self.enpassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
-        else:
-            self.enpassantPossible = ()
-        # castle move
-        if move.isCastleMove:
-            if move.endCol - move.startCol == 2: # kingside castle
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] # move rook
-                self.board[move.endRow][move.endCol+1] = "--" # erase old rook
-            else: # queenside castle
-                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] # move rook
-                self.board[move.endRow][move.endCol-2] = "--" # erase old rook
-        # update castling rights 
-        self.updateCastleRights(move)
-        self.castleRightsLogs.append(CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks, 
-                                                  self.currentCastlingRights.wqs, self.currentCastlingRights.bqs))
-   
-    # undo a move
-    def undoMove(self):
-        if len(self.moveLog) != 0: # check if there is a move to undo
-            move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
-            self.whiteToMove = not self.whiteToMove # switch players
-            # track location of kings
-            if move.pieceMoved == "wK":
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            if move.pieceMoved == "bK":
-                self.blackKingLocation = (move.startRow, move.startCol)
-            # undo en passant
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # undo 2 pawn square advance
-            if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
-            # undo castling rights
-            self.castleRightsLogs.pop() # remove new castle rights
-            newRights = self.castleRightsLogs[-1]
-            self.currentCastlingRights = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs) # set countcil rights to the previous one 
-            # undo castle move
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2: # kingside
-                    self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-1]
-                    self.board[move.endRow][move.endCol-1] = "--"
-                else: # queenside
-                    self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
-                    self.board[move.endRow][move.endCol+1] = "--"
-    
-    # update castle rights when a move is given
-    def updateCastleRights(self, move):
-        if move.pieceMoved == "wK":
-            self.currentCastlingRights.wks = False
-            self.currentCastlingRights.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRights.bks = False
-            self.currentCastlingRights.bqs = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0: #left rook
-                    self.currentCastlingRights.wqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRights.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0: #left rook
-                        self.currentCastlingRights.bqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRights.bks = False
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRights.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.wks = False
-        elif move.pieceCaptured == 'bR':
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRights.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRights.bks = False
-
-    # valid moves with checks
-    def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRights.wks, self.currentCastlingRights.bks,
-                                        self.currentCastlingRights.wqs, self.currentCastlingRights.bqs)
-        # 1. generate all possible moves
-        moves = self.getAllPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
-        else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        # 2. for each move, make the move
-        for i in range(len(moves)-1, -1, -1):
-            self.makeMove(moves[i])
-            # 3. generate all opponent's moves  
-            # 4. for each of your opponent's moves, see if they attack your king
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                # 5 if they attack your king then it's not a valid move
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
-        if len(moves) == 0: # chekmate or stalemate
-            if self.inCheck():
-                self.checkmate = True
-            else:
-                self.stalemate = True
-        else:
-            self.checkmate = False
-            self.stalemate = False
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRights = tempCastleRights
-        return moves
-    
-    # check if the current player in check
-    def inCheck(self):
-        if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
-        else:
-            return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
-
-    # check if enemy can attack square r, c
-    def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove # switch to opponent's side
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # switch back 
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: #square is under attack
-                return True
-        return False
-
-    # valid moves without checks
-    def getAllPossibleMoves(self):
-        moves = []
-        for r in range(len(self.board)): # rows 
-            for c in range(len(self.board[r])): # columns in a row
-                turn = self.board[r][c][0]
-                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
-                    piece = self.board[r][c][1]
-                    self.moveFunctions[piece](r, c , moves) # call move function for each type
-        return moves
-
-    # get all moves of every piece and add them to the list
-    def getPawnMoves(self, r, c, moves):
-        if self.whiteToMove: # white moves
-            if self.board[r-1][c] == "--": # 1 square move
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": # 2 square move
-                    moves.append(Move((r, c), (r-2, c), self.board))
-            if c-1 >= 0: # capture left
-                if self.board[r-1][c-1][0] == "b": # if pawn can capture
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: # capture right
-                if self.board[r-1][c+1][0] == "b": # if pawn can capture
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
-        else: # black moves
-            if self.board[r+1][c] == "--": # 1 square move
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == "--": # 2 square move
-                    moves.append(Move((r, c), (r+2, c), self.board))
-            if c-1 >= 0: # capture left
-                if self.board[r+1][c-1][0] == "w": # if pawn can capture
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: # capture right
-                if self.board[r+1][c+1][0] == "w": # if pawn can capture
-                    moves.append(Move((r, c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
-
-    def getRookMoves(self, r, c, moves):
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1)) # up down left right
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8: 
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor: # capture enemy piece
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else: # friendly piece
-                        break
-                else: # off the board
-                    break
-
-    def getKnightMoves(self, r, c, moves):
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        allyColor = "w" if self.whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # empty or enemy piece
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
-
-    def getBishopMoves(self, r, c, moves):
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1)) # diagonal moves
-        enemyColor = "b" if self.whiteToMove else "w"
-        for d in directions:
-            for i in range(1, 8):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8: 
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == "--":
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor: # capture enemy piece
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                        break
-                    else: # friendly piece
-                        break
-                else: # off the board
-                    break
+# This is the driver file. It handles user input and displaying the board state 
+import pygame as p
+from pygame import color
+import os
+import sys
+import threading
+import time
+import queue
+import traceback
+from collections import OrderedDict
+from ChessEngine import GameState, MoveList
+from BitboardEngine import BitboardGameState
+from ChessSearch import Searcher
+from MoveLog import MoveLog, moveToSan
+from OpeningBook import OpeningBook
+from Tablebase import Tablebase
+from Instrumentation import Instrumentation
+WIDTH = HEIGHT = 512
+DIMENSION = 8
+SQ_SIZE = HEIGHT // DIMENSION
+USE_BITBOARDS = False # use the bitboard backend for move generation, no faster than the mailbox one yet
+PLAYER_ONE = True # True if a human plays white, False if the computer does
+PLAYER_TWO = True # same as above for black
+SEARCH_TIME = 1.0 # seconds the computer may think per move
+BOOK_FILE = "Chess/book.bin" # opening book built with OpeningBook.py, used when it exists
+TABLEBASE_DIR = "Chess/tablebases" # endgame tables generated with Tablebase.py
+LOG_FILE = "Chess/logs.txt"
+LOG_FORMAT = "text" # "text", "jsonl" or "pgn", see MoveLog
+PROFILE_FILE = None # e.g. "Chess/profile.jsonl" to time move generation, search and frames, see Instrumentation
+PROFILE_INTERVAL = 5.0 # seconds between snapshots appended to PROFILE_FILE
+IMAGES = {}
+PIECE_FILES = {} # piece images as loaded from disk, before scaling
+ENGINE_RESULT = p.USEREVENT + 1 # posted by the engine worker when valid moves (and a computer move) are ready
 
-    def getQueenMoves(self, r, c, moves):
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
+# least recently used cache for fonts, rendered text and other surfaces that are expensive to create
+class AssetCache():
+    def __init__(self, maxSize=128):
+        self.maxSize = maxSize
+        self.assets = OrderedDict()
 
-    def getKingMoves(self, r, c, moves):
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-        allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = r + kingMoves[i][0]
-            endCol = c + kingMoves[i][1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # empty or enemy piece
-                    moves.append(Move((r, c), (endRow, endCol), self.board))
+    # returns the asset stored under key, calling create() to make it if it is not cached
+    def get(self, key, create):
+        if key in self.assets:
+            self.assets.move_to_end(key)
+            return self.assets[key]
+        asset = create()
+        self.assets[key] = asset
+        if len(self.assets) > self.maxSize: # drop the least recently used asset
+            self.assets.popitem(last=False)
+        return asset
 
-    # get all valid castle moves
-    def getCastleMoves(self, r, c, moves):
-        if self.squareUnderAttack(r, c):
-            return # can't castle in check
-        if (self.whiteToMove and self.currentCastlingRights.wks) or (not self.whiteToMove and self.currentCastlingRights.bks):
-            self.getKingSideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRights.wqs) or (not self.whiteToMove and self.currentCastlingRights.bqs):
-            self.getQueenSideCastleMoves(r, c , moves)
-    
-    def getKingSideCastleMoves(self, r, c, moves):
-        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
-            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
-                moves.append(Move((r, c), (r, c+2), self.board, isCastleMove=True))
+ASSETS = AssetCache()
 
+def getFont(name, size, bold=False, italic=False):
+    return ASSETS.get(("font", name, size, bold, italic), lambda: p.font.SysFont(name, size, bold, italic))
 
-    def getQueenSideCastleMoves(self, r, c, moves):
-        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
-            if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
-                moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
+def renderText(text, size, color):
+    font = getFont("Helvitca", size, True)
+    return ASSETS.get(("text", text, size, color), lambda: font.render(text, 0, p.Color(color)))
 
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+# translucent square used to highlight squares
+def getOverlay(color, size):
+    def createOverlay():
+        s = p.Surface((size, size))
+        s.set_alpha(100) # transparency
+        s.fill(p.Color(color))
+        return s
+    return ASSETS.get(("overlay", color, size), createOverlay)
 
-# store all information about a particular move
-class Move():
-    # map keys to values
-    # key : value
-    ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
-                   "5": 3, "6": 2, "7": 1, "8": 0}
-    rowsToRanks = {v: k for k, v in ranksToRows.items()}
-    filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3,
-                   "e": 4, "f": 5, "g": 6, "h": 7}
-    colsToFiles = {v: k for k, v in filesToCols.items()}
+# initialises a global dictionary of images scaled to sqSize
+# the files are only read once, scaled images are cached for every size
+def loadImages(sqSize=SQ_SIZE):
+    pieces = ['bB', 'bK', 'bN', 'bP', 'bQ', 'bR', 'wB', 'wK', 'wN', 'wP', 'wQ', 'wR']
+    for piece in pieces:
+        if piece not in PIECE_FILES:
+            PIECE_FILES[piece] = p.image.load("Chess/images/" + piece + ".png")
+        IMAGES[piece] = ASSETS.get(("piece", piece, sqSize),
+                                   lambda: p.transform.scale(PIECE_FILES[piece], (sqSize, sqSize)))
 
-    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == "wP" and self.endRow == 0) or (self.pieceMoved == "bP" and self.endRow == 7)
-        # en passant
-        self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = "wP" if self.pieceMoved == "bP" else "bP"
-        # castle move
-        self.isCastleMove = isCastleMove
-        
-        self.moveID = self.startRow * 10000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+# creates a game state with the configured backend
+def newGameState():
+    return BitboardGameState() if USE_BITBOARDS else GameState()
 
-    # override equal notation
-    def __eq__(self, other):
-        if isinstance(other, Move):
-            return self.moveID == other.moveID
-        return False
+# result of the game so far in PGN form
+def gameResult(gs):
+    if gs.checkmate:
+        return "0-1" if gs.whiteToMove else "1-0"
+    if gs.stalemate or gs.draw:
+        return "1/2-1/2"
+    return "*"
 
-    def getChessNotation(self):
-        return self.getRankFiles(self.startRow, self.startCol) + self.getRankFiles(self.endRow, self.endCol)
+# runs move generation and search on a background thread and posts the results as ENGINE_RESULT events
+# jobs work on a copy of the game state, so the screen never shows a half searched position
+class EngineWorker():
+    def __init__(self):
+        self.searcher = Searcher(book=OpeningBook(BOOK_FILE) if os.path.exists(BOOK_FILE) else None,
+                                 tablebase=Tablebase(TABLEBASE_DIR))
+        self.jobs = queue.Queue()
+        self.jobId = 0 # results of older jobs are stale and dropped
+        threading.Thread(target=self.run, daemon=True).start()
 
-    def getRankFiles(self, r, c):
-        return self.colsToFiles[c] + self.rowsToRanks[r]
+    # find the valid moves of gs and, if think is True, the computer's move
+    def request(self, gs, think):
+        self.cancel()
+        self.jobs.put((self.jobId, gs.copy(), think))
 
-# This is the driver file. It handles user input and displaying the board state 
-import pygame as p
-from pygame import color
-import time
-WIDTH = HEIGHT = 512
-DIMENSION = 8
-SQ_SIZE = HEIGHT // DIMENSION
-MAX_FPS = 15
-IMAGES = {}
-open('Chess/logs.txt', 'w').close()
+    # drop the job in progress, a running search stops within a few hundred nodes
+    def cancel(self):
+        self.jobId += 1
+        self.searcher.stop()
 
-# initialises a global dictionary of images
-def loadImages():
-    pieces = ['bB', 'bK', 'bN', 'bP', 'bQ', 'bR', 'wB', 'wK', 'wN', 'wP', 'wQ', 'wR']
-    for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load("Chess/images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+    def run(self):
+        while True:
+            jobId, gs, think = self.jobs.get()
+            # clear the stop before checking the job, a cancel after the check then still stops the search
+            self.searcher.clearStop()
+            if jobId != self.jobId:
+                continue
+            validMoves = MoveList()
+            checkmate = stalemate = draw = False
+            move = None
+            try:
+                validMoves = gs.getValidMoves()
+                checkmate, stalemate, draw = gs.checkmate, gs.stalemate, gs.draw
+                if think and validMoves and not draw:
+                    move = self.searcher.findBestMove(gs, validMoves, SEARCH_TIME)
+            except Exception: # e.g. a corrupt book or table file, report it and keep the game going
+                print("engine job failed:", file=sys.stderr)
+                traceback.print_exc(file=sys.stderr)
+                if think and validMoves and not draw:
+                    move = validMoves[0]
+            if jobId == self.jobId:
+                p.event.post(p.event.Event(ENGINE_RESULT, jobId=jobId, validMoves=validMoves, move=move,
+                                           checkmate=checkmate, stalemate=stalemate, draw=draw))
 
 # handles user input and graphic updating
+# the loop sleeps in p.event.wait until there is input or an engine result to handle
 def main():
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
-    clock = p.time.Clock()
+    p.event.set_blocked(p.MOUSEMOTION) # the board does not react to motion, so don't wake up for it
     screen.fill(p.Color("white"))
-    gs = GameState()
-    validMoves = gs.getValidMoves()
-    moveMade = False # check if a move has been made
+    renderer = BoardRenderer(screen)
     loadImages()
+    worker = EngineWorker()
+    log = MoveLog(LOG_FILE, LOG_FORMAT)
+    gs = newGameState()
+    gameId = log.newGame()
+    instrumentation = None
+    if PROFILE_FILE is not None:
+        instrumentation = Instrumentation().enable()
+        instrumentation.watch("search", worker.searcher.stats)
+        instrumentation.reset(gameId)
+        instrumentation.startDumping(PROFILE_FILE, PROFILE_INTERVAL)
+    validMoves = MoveList() # filled in when the worker reports back
+    thinking = False # the worker has a job for the current position
+    moveMade = True # check if a move has been made, True so the first position gets analysed
     running = True
     sqSelected = () # keep track of user's last click
     playerClicks = [] # keep track of player clicks as two tuples [(x1,y1),(x2,y2)]
     gameOver = False
     while running:
-        for e in p.event.get():
+        humanTurn = (gs.whiteToMove and PLAYER_ONE) or (not gs.whiteToMove and PLAYER_TWO)
+        if moveMade:
+            validMoves = MoveList()
+            worker.request(gs, not humanTurn)
+            thinking = True
+            moveMade = False
+
+        text = None
+        if gs.checkmate:
+            gameOver = True
+            if gs.whiteToMove:
+                text = "Black Checkmates!"
+            else:
+                text = "White Checkmates!"
+        elif gs.stalemate:
+            gameOver = True
+            text = "Stalemate!"
+        elif gs.draw:
+            gameOver = True
+            text = "Draw by fifty moves!" if gs.halfmoveClock >= 100 else "Draw by repetition!"
+        if instrumentation is not None:
+            frameStart = time.perf_counter()
+        dirtyRects = renderer.draw(gs, validMoves, sqSelected, text)
+        if dirtyRects: # only push the changed parts of the screen
+            p.display.update(dirtyRects)
+        if instrumentation is not None:
+            instrumentation.recordFrame(time.perf_counter() - frameStart)
+
+        for e in [p.event.wait()] + p.event.get(): # sleep until something happens
             if e.type == p.QUIT:
                 running = False
+                worker.cancel()
+                log.endGame(gameId, gameResult(gs))
+                log.close()
+                if instrumentation is not None:
+                    instrumentation.stopDumping()
+                    instrumentation.dump(PROFILE_FILE)
+                    instrumentation.disable()
+
+            # engine worker handler
+            elif e.type == ENGINE_RESULT:
+                if e.jobId == worker.jobId: # results for an earlier position are ignored
+                    validMoves = e.validMoves
+                    gs.checkmate, gs.stalemate, gs.draw = e.checkmate, e.stalemate, e.draw
+                    thinking = False
+                    if e.move is not None: # computer move
+                        log.logMove(gameId, e.move, moveToSan(e.move, validMoves))
+                        gs.makeMove(e.move)
+                        moveMade = True
             
             # mouse handler
             elif e.type == p.MOUSEBUTTONDOWN:
-                if not gameOver:
-                    location = p.mouse.get_pos() # location of mouse
+                if not gameOver and humanTurn and not thinking:
+                    location = e.pos # location of mouse
                     col = location[0]//SQ_SIZE
                     row = location[1]//SQ_SIZE
                     if sqSelected == (row, col): # the same square is clicked twice
@@ -399,70 +223,89 @@ def main():
                         sqSelected = (row, col)
                         playerClicks.append(sqSelected)
                     if len(playerClicks) == 2:
-                        move = Move(playerClicks[0], playerClicks[1], gs.board)
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                t = time.localtime()
-                                current_time = time.strftime("%H:%M:%S", t)
-                                with open("Chess/logs.txt", "a") as text_file:
-                                    text_file.write(current_time + " " + move.getChessNotation() + "\n")
-                                gs.makeMove(validMoves[i])
-                                moveMade = True
-                                sqSelected = () # reset clicks
-                                playerClicks = []
-                        if not moveMade:
+                        move = validMoves.findMove(playerClicks[0], playerClicks[1])
+                        if move is not None:
+                            log.logMove(gameId, move, moveToSan(move, validMoves))
+                            gs.makeMove(move)
+                            moveMade = True
+                            sqSelected = () # reset clicks
+                            playerClicks = []
+                        else:
                             playerClicks = [sqSelected]
             
             # key handler
             elif e.type == p.KEYDOWN: 
-                if e.key == p.K_z: # undo a move when "z" is pressed
+                if e.key == p.K_z and len(gs.moveLog) != 0: # undo a move when "z" is pressed
                     gs.undoMove()
+                    log.undoMove(gameId)
+                    gs.checkmate = gs.stalemate = gs.draw = False
                     moveMade = True
+                    gameOver = False
                 if e.key == p.K_r: # reset the board when "r" is pressed
-                    gs = GameState()
-                    validMoves = gs.getValidMoves()
+                    log.endGame(gameId, gameResult(gs))
+                    gs = newGameState()
+                    gameId = log.newGame()
+                    if instrumentation is not None: # the last figures of the old game, then start over
+                        instrumentation.dump(PROFILE_FILE)
+                        instrumentation.reset(gameId)
                     sqSelected = ()
                     playerClicks = []
-                    moveMade = False
-        if moveMade:
-            validMoves = gs.getValidMoves()
-            moveMade = False
-        drawGameState(screen, gs, validMoves, sqSelected)
-        if gs.checkmate:
-            gameOver = True
-            if gs.whiteToMove:
-                drawText(screen, "Black Checkmates!")
-            else:
-                drawText(screen, "White Checkmates!")
-        elif gs.stalemate:
-            gameOver = True
-            drawText(screen, "Stalemate!")
-        clock.tick(MAX_FPS) 
-        p.display.flip()
+                    moveMade = True
+                    gameOver = False
 
-# highlight selected piece and available moves
-def highlightSqaures(screen, gs, validMoves, sqSelected):
+# squares to highlight for the selected piece and its available moves, as {(row, col): color name}
+def highlightSqaures(gs, validMoves, sqSelected):
+    highlights = {}
     if sqSelected != ():
         r, c = sqSelected
         if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"): # check if the piece can be moved
-            # highlight piece
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100) # transparency
-            s.fill(p.Color("blue"))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
-            # highlight moves
-            s.fill(p.Color("orange"))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
+            highlights[(r, c)] = "blue" # highlight piece
+            for move in validMoves.movesFrom(r, c): # highlight moves
+                highlights[(move.endRow, move.endCol)] = "orange"
+    return highlights
+
+# draws the game state, remembering what is on screen so only changed squares get redrawn
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = p.Surface((WIDTH, HEIGHT)) # the empty board, drawn once
+        drawBoard(self.background)
+        self.shownBoard = None # copy of the board as it is on screen, None forces a full redraw
+        self.shownHighlights = {}
+        self.shownText = None
+
+    # draws what changed since the last call and returns the rects of the screen that need updating
+    def draw(self, gs, validMoves, sqSelected, text=None):
+        highlights = highlightSqaures(gs, validMoves, sqSelected)
+        if self.shownBoard is None or (self.shownText is not None and text != self.shownText):
+            dirty = [(r, c) for r in range(DIMENSION) for c in range(DIMENSION)]
+        else:
+            # covers moves, captures, castling rooks, en passant and undo alike
+            dirty = [(r, c) for r in range(DIMENSION) for c in range(DIMENSION)
+                     if gs.board[r][c] != self.shownBoard[r][c]]
+            for square in highlights.keys() | self.shownHighlights.keys():
+                if highlights.get(square) != self.shownHighlights.get(square) and square not in dirty:
+                    dirty.append(square)
+        dirtyRects = []
+        for r, c in dirty:
+            dirtyRects.append(self.drawSquare(r, c, gs.board[r][c], highlights.get((r, c))))
+        if text is not None and (dirty or text != self.shownText): # the text sits on top of the squares
+            dirtyRects.append(drawText(self.screen, text))
+        self.shownBoard = [row[:] for row in gs.board]
+        self.shownHighlights = highlights
+        self.shownText = text
+        return dirtyRects
 
-# draws all the graphics in the current game state
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen) #draws the board
-    highlightSqaures(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board) #draws pieces on the board
+    def drawSquare(self, r, c, piece, highlight):
+        rect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(self.background, rect, rect)
+        if highlight is not None:
+            self.screen.blit(getOverlay(highlight, SQ_SIZE), rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+        return rect
 
-# draws the pieces on the board using the current GameState.board
+# draws the squares of the board
 def drawBoard(screen):
     colors = [p.Color("white"), p.Color("gray")]
     for r in range(DIMENSION):
@@ -470,20 +313,14 @@ def drawBoard(screen):
             color = colors[((r+c)%2)]
             p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-
+# draws centered text and returns the rect it covers
 def drawText(screen, text):
-    font = p.font.SysFont("Helvitca", 64, True, False)
-    textObject = font.render(text, 0, p.Color("black"))
+    textObject = renderText(text, 64, "black")
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
     screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color("red"))
+    textObject = renderText(text, 64, "red")
     screen.blit(textObject, textLocation.move(2, 2))
+    return p.Rect(textLocation.topleft, (textObject.get_width() + 2, textObject.get_height() + 2))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
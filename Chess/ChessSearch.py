@@ -0,0 +1,298 @@
+# finds the best move for the side to move with an alpha-beta search
+import time
+from ChessEngine import CAPTURES, QUIETS
+from Evaluation import evaluate
+
+CHECKMATE = 100000
+STALEMATE = 0
+DRAW = 0 # repetitions and the fifty move rule
+MAX_PLY = 128
+MAX_DEPTH = 64
+
+# transposition table flags
+EXACT = 0
+LOWERBOUND = 1 # the score is at least this, the search failed high
+UPPERBOUND = 2 # the score is at most this, the search failed low
+
+# move ordering: hash move, then captures by most valuable victim / least valuable attacker, then killers, then history
+# each stage is only generated once the ones before it failed to cut the node off
+VICTIM_ORDER = {"-": 0, "P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}
+
+class SearchTimeout(Exception):
+    pass
+
+# fixed size table of searched positions, indexed by the low bits of the zobrist key
+class TranspositionTable():
+    def __init__(self, size=1 << 18):
+        self.size = 1 << (size.bit_length() - 1) # round down to a power of two
+        self.mask = self.size - 1
+        self.entries = [None] * self.size
+        self.generation = 0 # bumped every search so stale entries get replaced first
+        self.probes = 0
+        self.hits = 0
+
+    def newSearch(self):
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+    # returns (key, depth, flag, score, moveID, generation) or None
+    def probe(self, key):
+        self.probes += 1
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    # replace an entry from an older search, the same position or a shallower search
+    def store(self, key, depth, flag, score, moveID):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[5] != self.generation or entry[0] == key or depth >= entry[1]:
+            self.entries[index] = (key, depth, flag, score, moveID, self.generation)
+
+# mate scores are stored relative to the node so they stay right when reached at another ply
+def scoreToTable(score, ply):
+    if score > CHECKMATE - MAX_PLY:
+        return score + ply
+    if score < -CHECKMATE + MAX_PLY:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score > CHECKMATE - MAX_PLY:
+        return score - ply
+    if score < -CHECKMATE + MAX_PLY:
+        return score + ply
+    return score
+
+# negamax alpha-beta search with iterative deepening under a wall-clock limit
+# keep one Searcher per computer player so the transposition table carries over between moves
+# with an OpeningBook or a Tablebase, positions they cover are answered from them without searching
+class Searcher():
+    def __init__(self, ttSize=1 << 18, book=None, tablebase=None):
+        self.tt = TranspositionTable(ttSize)
+        self.book = book
+        self.tablebase = tablebase
+        self.killers = [[None, None] for i in range(MAX_PLY)]
+        self.history = {}
+        # move lists per ply, refilled instead of reallocated
+        self.captureLists = [[] for i in range(MAX_PLY)]
+        self.quietLists = [[] for i in range(MAX_PLY)]
+        self.nodes = 0
+        self.cutoffs = 0
+        self.deadline = 0
+        # set by stop() from another thread, searches give up at their next time check until it is cleared
+        # iterativeDeepening leaves it alone, so a stop that lands before a search starts is not lost
+        self.stopped = False
+        self.depthReached = 0
+        self.bestScore = 0
+        # totals over every search, the figures above are for the last one
+        self.searches = 0
+        self.totalNodes = 0
+        self.totalCutoffs = 0
+
+    # returns the best move found within timeLimit seconds, or None if there are no valid moves
+    def findBestMove(self, gs, validMoves=None, timeLimit=1.0, maxDepth=MAX_DEPTH):
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        if len(validMoves) <= 1: # nothing to choose from
+            return validMoves[0] if validMoves else None
+        if self.book is not None:
+            move = self.book.pickMove(gs, validMoves)
+            if move is not None:
+                return move
+        if self.tablebase is not None:
+            move = self.tablebase.bestMove(gs, validMoves)
+            if move is not None:
+                return move
+        iterations = self.iterativeDeepening(gs, validMoves, timeLimit, maxDepth)
+        if not iterations: # not even depth 1 finished in time
+            return validMoves[0]
+        return iterations[-1][2]
+
+    # search the given root moves one depth deeper at a time until time runs out
+    # returns (depth, score, best move) for every completed depth
+    def iterativeDeepening(self, gs, validMoves, timeLimit=1.0, maxDepth=MAX_DEPTH):
+        self.deadline = time.time() + timeLimit
+        self.nodes = 0
+        self.cutoffs = 0
+        self.depthReached = 0
+        self.killers = [[None, None] for i in range(MAX_PLY)]
+        self.history = {}
+        self.tt.newSearch()
+        # the search calls getValidMoves, which overwrites the game end flags
+        checkmate, stalemate, draw = gs.checkmate, gs.stalemate, gs.draw
+        rootDepth = len(gs.moveLog)
+        moves = list(validMoves)
+        iterations = []
+        try:
+            for depth in range(1, maxDepth + 1):
+                score, move = self.searchRoot(gs, moves, depth)
+                iterations.append((depth, score, move))
+                self.bestScore = score
+                self.depthReached = depth
+                # search the best move first on the next iteration
+                moves.remove(move)
+                moves.insert(0, move)
+                if abs(score) > CHECKMATE - MAX_PLY: # forced mate found
+                    break
+        except SearchTimeout:
+            while len(gs.moveLog) > rootDepth: # unwind the moves made by the interrupted search
+                gs.undoMove()
+        gs.checkmate, gs.stalemate, gs.draw = checkmate, stalemate, draw
+        self.searches += 1
+        self.totalNodes += self.nodes
+        self.totalCutoffs += self.cutoffs
+        return iterations
+
+    # make the running search, and any started before clearStop(), return what it has
+    def stop(self):
+        self.stopped = True
+
+    def clearStop(self):
+        self.stopped = False
+
+    # figures of the last search and totals so far, for Instrumentation snapshots
+    def stats(self):
+        tt = self.tt
+        return {"nodes": self.nodes, "cutoffs": self.cutoffs, "depth": self.depthReached, "score": self.bestScore,
+                "searches": self.searches, "totalNodes": self.totalNodes, "totalCutoffs": self.totalCutoffs,
+                "ttProbes": tt.probes, "ttHits": tt.hits, "ttHitRate": round(tt.hits / tt.probes, 4) if tt.probes else 0.0}
+
+    def searchRoot(self, gs, moves, depth):
+        alpha = -CHECKMATE - 1
+        beta = CHECKMATE + 1
+        bestMove = moves[0]
+        for move in moves:
+            gs.makeMove(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, 1)
+            gs.undoMove()
+            if score > alpha:
+                alpha = score
+                bestMove = move
+        self.tt.store(gs.zobristKey, depth, EXACT, alpha, bestMove.moveID)
+        return alpha, bestMove
+
+    def negamax(self, gs, depth, alpha, beta, ply):
+        if depth <= 0:
+            return self.quiescence(gs, alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes & 255 == 0 and (self.stopped or time.time() > self.deadline):
+            raise SearchTimeout()
+        if ply >= MAX_PLY:
+            return evaluate(gs)
+        # a position seen before in the game or the search is scored as a draw, the first repetition is enough
+        if gs.halfmoveClock >= 100 or gs.isRepetition():
+            return DRAW
+        alphaOriginal = alpha
+        key = gs.zobristKey
+        hashMoveID = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            hashMoveID = entry[4]
+            if entry[1] >= depth:
+                score = scoreFromTable(entry[3], ply)
+                if entry[2] == EXACT:
+                    return score
+                elif entry[2] == LOWERBOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        bestScore = -CHECKMATE - 1
+        bestMove = None
+        for move in self.pickMoves(gs, hashMoveID, ply):
+            gs.makeMove(move)
+            score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self.cutoffs += 1
+                if isQuiet(move): # remember quiet moves that refute this line
+                    self.storeKiller(move, ply)
+                    historyKey = (move.pieceMoved, move.endRow * 8 + move.endCol)
+                    self.history[historyKey] = self.history.get(historyKey, 0) + depth * depth
+                break
+        if bestMove is None: # no valid moves
+            return -CHECKMATE + ply if gs.inCheck() else STALEMATE
+        if bestScore <= alphaOriginal:
+            flag = UPPERBOUND
+        elif bestScore >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        self.tt.store(gs.zobristKey, depth, flag, scoreToTable(bestScore, ply), bestMove.moveID)
+        return bestScore
+
+    def storeKiller(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+
+    # valid moves in search order, generated a stage at a time:
+    # the hash move, captures and promotions, killers, then the remaining quiet moves by history
+    def pickMoves(self, gs, hashMoveID, ply):
+        hashMove = gs.getValidMove(hashMoveID) if hashMoveID is not None else None
+        if hashMove is not None:
+            yield hashMove
+        captures = gs.getValidMoves(self.captureLists[ply], CAPTURES)
+        captures.sort(key=captureOrder, reverse=True)
+        for move in captures:
+            if move.moveID != hashMoveID:
+                yield move
+        killers = [moveID for moveID in self.killers[ply] if moveID is not None and moveID != hashMoveID]
+        for moveID in killers:
+            move = gs.getValidMove(moveID)
+            if move is not None and isQuiet(move):
+                yield move
+        history = self.history
+        quiets = gs.getValidMoves(self.quietLists[ply], QUIETS)
+        quiets.sort(key=lambda move: history.get((move.pieceMoved, move.endRow * 8 + move.endCol), 0), reverse=True)
+        for move in quiets:
+            if move.moveID != hashMoveID and move.moveID not in killers:
+                yield move
+
+    # search captures and promotions only until the position is quiet, so the leaves are not scored
+    # in the middle of an exchange; the side to move can always stand pat on the static score
+    def quiescence(self, gs, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and (self.stopped or time.time() > self.deadline):
+            raise SearchTimeout()
+        standPat = evaluate(gs)
+        if standPat >= beta or ply >= MAX_PLY:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        captures = gs.getValidMoves(self.captureLists[ply], CAPTURES)
+        captures.sort(key=captureOrder, reverse=True)
+        for move in captures:
+            gs.makeMove(move)
+            score = -self.quiescence(gs, -beta, -alpha, ply + 1)
+            gs.undoMove()
+            if score >= beta:
+                self.cutoffs += 1
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+def isQuiet(move):
+    return move.pieceCaptured == "--" and not move.isPawnPromotion
+
+# most valuable victim first, then least valuable attacker, a promotion counts as winning a queen
+def captureOrder(move):
+    victim = VICTIM_ORDER[move.pieceCaptured[1]] + (VICTIM_ORDER["Q"] if move.isPawnPromotion else 0)
+    return victim * 8 - VICTIM_ORDER[move.pieceMoved[1]]
+
+# search the position once with a fresh searcher
+def findBestMove(gs, validMoves=None, timeLimit=1.0, maxDepth=MAX_DEPTH):
+    return Searcher().findBestMove(gs, validMoves, timeLimit, maxDepth)
@@ -0,0 +1,48 @@
+# streaming reader for EPD files: four FEN fields followed by "opcode operand;" operations
+# lines are read one at a time so files with millions of positions never sit in memory
+import gzip
+from ChessEngine import GameState
+
+# split the operations part of an EPD line into {opcode: operand}, quoted operands keep their semicolons
+def parseOperations(text):
+    operations = {}
+    operation = ""
+    quoted = False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            addOperation(operations, operation)
+            operation = ""
+        else:
+            operation += char
+    addOperation(operations, operation)
+    return operations
+
+def addOperation(operations, operation):
+    parts = operation.strip().split(None, 1)
+    if parts:
+        operand = parts[1].strip() if len(parts) > 1 else ""
+        if len(operand) >= 2 and operand[0] == operand[-1] == '"':
+            operand = operand[1:-1]
+        operations[parts[0]] = operand
+
+# returns (FEN, operations) for one EPD line, the hmvc and fmvn operations fill in the move counters
+def parseEpdLine(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD line needs at least 4 fields: " + line)
+    operations = parseOperations(fields[4]) if len(fields) > 4 else {}
+    fen = " ".join(fields[:4]) + " " + operations.get("hmvc", "0") + " " + operations.get("fmvn", "1")
+    return fen, operations
+
+# yields (game state, operations) for every position in the file, .gz files are decompressed on the fly
+def readEpd(path, backend=GameState):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as epdFile:
+        for line in epdFile:
+            line = line.strip()
+            if line == "" or line[0] == "#":
+                continue
+            fen, operations = parseEpdLine(line)
+            yield backend.fromFen(fen), operations
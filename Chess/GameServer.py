@@ -0,0 +1,333 @@
+# asyncio game service hosting many games in one process
+# clients talk newline delimited JSON over TCP, one request and one response per line:
+#   {"op": "new", "fen": "..."}                      -> {"ok": true, "game": id, "fen": ..., "moves": [...], ...}
+#   {"op": "move", "game": id, "move": "e2e4"}       -> the state after the move
+#   {"op": "state" / "undo" / "close", "game": id}
+# games that sit idle are packed into snapshots (start FEN and moves) and rebuilt on their next request,
+# so only maxActive GameState objects are ever kept in memory; snapshots are dropped after snapshotTimeout
+# seconds or once there are more than maxSnapshots of them, for games abandoned without a close
+# run from the repository root: python Chess/GameServer.py serve --port 8765
+# or play random games against an in-process server: python Chess/GameServer.py demo --games 200
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import sys
+import time
+import traceback
+from collections import OrderedDict
+from ChessEngine import GameState, Move, START_FEN
+from BitboardEngine import BACKENDS, DEFAULT_BACKEND
+from Instrumentation import Instrumentation
+
+# "e2e4" -> ((6, 4), (4, 4)), a promotion letter at the end is accepted but the engine always makes a queen
+def parseUci(text):
+    if len(text) not in (4, 5) or text[0] not in Move.filesToCols or text[2] not in Move.filesToCols or \
+            text[1] not in Move.ranksToRows or text[3] not in Move.ranksToRows:
+        raise ValueError("not a move in e2e4 form: " + text)
+    return (Move.ranksToRows[text[1]], Move.filesToCols[text[0]]), (Move.ranksToRows[text[3]], Move.filesToCols[text[2]])
+
+# rebuild a move that was valid in gs from its e2e4 form, without generating the valid moves
+def uciToMove(gs, text):
+    startSq, endSq = parseUci(text)
+    piece = gs.board[startSq[0]][startSq[1]]
+    isEnpassantMove = piece[1] == "P" and startSq[1] != endSq[1] and endSq == gs.enpassantPossible
+    isCastleMove = piece[1] == "K" and abs(endSq[1] - startSq[1]) == 2
+    return Move(startSq, endSq, gs.board, isEnpassantMove, isCastleMove)
+
+# one hosted game, requests on it are handled one at a time under its lock
+class Game():
+    def __init__(self, gs, startFen):
+        self.gs = gs
+        self.startFen = startFen
+        self.lock = asyncio.Lock()
+        self.validMoves = None # valid moves of the current position, computed on demand
+        self.lastUsed = time.monotonic()
+
+    def getValidMoves(self):
+        if self.validMoves is None:
+            self.validMoves = self.gs.getValidMoves()
+        return self.validMoves
+
+    def state(self, gameId):
+        validMoves = self.getValidMoves()
+        return {"ok": True, "game": gameId, "fen": self.gs.toFen(),
+                "moves": [move.getChessNotation() for move in validMoves],
+                "checkmate": self.gs.checkmate, "stalemate": self.gs.stalemate, "draw": self.gs.draw}
+
+    # compact form of an evicted game: (start FEN, moves in e2e4 form separated by spaces)
+    def snapshot(self):
+        return (self.startFen, " ".join([move.getChessNotation() for move in self.gs.moveLog]))
+
+# the active games in least recently used order plus the snapshots of the evicted ones
+class GameStore():
+    def __init__(self, backend=GameState, maxActive=1000, idleTimeout=60.0, maxSnapshots=100000,
+                 snapshotTimeout=86400.0):
+        self.backend = backend
+        self.maxActive = maxActive
+        self.idleTimeout = idleTimeout # seconds without requests before a game is evicted
+        self.maxSnapshots = maxSnapshots
+        self.snapshotTimeout = snapshotTimeout # seconds an evicted game is kept before it is dropped
+        self.active = OrderedDict() # gameId -> Game
+        self.evicted = OrderedDict() # gameId -> (snapshot, time of eviction), oldest first
+        self.evictions = 0
+        self.restores = 0
+        self.expired = 0
+
+    def newGame(self, fen=None):
+        fen = fen or START_FEN
+        gameId = secrets.token_urlsafe(9)
+        self.active[gameId] = Game(self.backend.fromFen(fen), fen)
+        self.evictOverflow()
+        return gameId
+
+    # the game with this id, rebuilt from its snapshot if it was evicted
+    def getGame(self, gameId):
+        game = self.active.get(gameId)
+        if game is None:
+            entry = self.evicted.pop(gameId, None)
+            if entry is None:
+                raise KeyError("no such game: " + str(gameId))
+            game = self.restore(entry[0])
+            self.active[gameId] = game
+            self.restores += 1
+            self.evictOverflow()
+        self.active.move_to_end(gameId)
+        game.lastUsed = time.monotonic()
+        return game
+
+    def restore(self, snapshot):
+        startFen, moves = snapshot
+        gs = self.backend.fromFen(startFen)
+        for text in moves.split(): # the moves were validated when they were first made
+            gs.makeMove(uciToMove(gs, text))
+        return Game(gs, startFen)
+
+    def closeGame(self, gameId):
+        if self.active.pop(gameId, None) is None and self.evicted.pop(gameId, None) is None:
+            raise KeyError("no such game: " + str(gameId))
+
+    def evict(self, gameId):
+        self.evicted[gameId] = (self.active.pop(gameId).snapshot(), time.monotonic())
+        self.evictions += 1
+        if len(self.evicted) > self.maxSnapshots:
+            self.evicted.popitem(last=False)
+            self.expired += 1
+
+    # drop the snapshots older than snapshotTimeout
+    def expireSnapshots(self):
+        cutoff = time.monotonic() - self.snapshotTimeout
+        while self.evicted:
+            gameId, (snapshot, evictedAt) = next(iter(self.evicted.items()))
+            if evictedAt > cutoff: # the rest were evicted even later
+                break
+            del self.evicted[gameId]
+            self.expired += 1
+
+    # keep at most maxActive games in memory, evicting the least recently used ones that are not busy
+    def evictOverflow(self):
+        if len(self.active) <= self.maxActive:
+            return
+        for gameId in list(self.active):
+            if len(self.active) <= self.maxActive:
+                break
+            if not self.active[gameId].lock.locked():
+                self.evict(gameId)
+
+    # evict every game that has been idle for longer than idleTimeout
+    def evictIdle(self):
+        cutoff = time.monotonic() - self.idleTimeout
+        for gameId in list(self.active):
+            game = self.active[gameId]
+            if game.lastUsed > cutoff: # the rest were used even more recently
+                break
+            if not game.lock.locked():
+                self.evict(gameId)
+        self.expireSnapshots()
+
+class GameServer():
+    def __init__(self, store=None):
+        self.store = store or GameStore()
+        self.requests = 0
+
+    # answer one request, errors are returned to the client instead of closing the connection
+    async def handle(self, request):
+        self.requests += 1
+        try:
+            op = request.get("op")
+            if op == "new":
+                fen = request.get("fen")
+                if fen is not None and not isinstance(fen, str):
+                    raise ValueError("fen must be a string")
+                gameId = self.store.newGame(fen)
+                game = self.store.getGame(gameId)
+                return game.state(gameId)
+            gameId = request.get("game")
+            if not isinstance(gameId, str):
+                raise ValueError("game must be a game id string")
+            game = self.store.getGame(gameId)
+            async with game.lock:
+                if op == "state":
+                    return game.state(gameId)
+                if op == "move":
+                    text = request.get("move")
+                    if not isinstance(text, str):
+                        raise ValueError("move must be a string in e2e4 form")
+                    startSq, endSq = parseUci(text)
+                    move = game.getValidMoves().findMove(startSq, endSq)
+                    if move is None:
+                        return {"ok": False, "game": gameId, "error": "illegal move: " + text}
+                    game.gs.makeMove(move)
+                    game.validMoves = None
+                    return game.state(gameId)
+                if op == "undo":
+                    game.gs.undoMove()
+                    game.validMoves = None
+                    return game.state(gameId)
+                if op == "close":
+                    self.store.closeGame(gameId)
+                    return {"ok": True, "game": gameId}
+            return {"ok": False, "error": "unknown op: " + str(op)}
+        except (KeyError, ValueError) as error:
+            return {"ok": False, "error": str(error.args[0]) if error.args else repr(error)}
+        except Exception as error: # a bug, but one request should not take the connection down with it
+            traceback.print_exc(file=sys.stderr)
+            return {"ok": False, "error": "internal error: " + repr(error)}
+
+    # figures for Instrumentation snapshots
+    def stats(self):
+        store = self.store
+        return {"requests": self.requests, "activeGames": len(store.active), "evictedGames": len(store.evicted),
+                "evictions": store.evictions, "restores": store.restores, "expired": store.expired}
+
+    async def serveClient(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as error:
+                    response = {"ok": False, "error": "bad request: " + str(error)}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response, separators=(",", ":")).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def evictLoop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.store.evictIdle()
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self.server = await asyncio.start_server(self.serveClient, host, port)
+        self.evictTask = asyncio.create_task(self.evictLoop(min(self.store.idleTimeout, 5.0)))
+        return self.server
+
+    async def close(self):
+        self.evictTask.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+# stand-in client, one connection with one request in flight at a time
+class GameClient():
+    async def connect(self, host="127.0.0.1", port=8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+
+    async def request(self, op, **fields):
+        fields["op"] = op
+        self.writer.write(json.dumps(fields).encode() + b"\n")
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+# play one game of random moves, also sending an illegal move now and then
+async def playRandomGame(client, rng, maxMoves):
+    state = await client.request("new")
+    gameId = state["game"]
+    for i in range(maxMoves):
+        if not state["moves"]:
+            break
+        if rng.random() < 0.05:
+            rejected = await client.request("move", game=gameId, move="a1a1")
+            assert not rejected["ok"]
+        state = await client.request("move", game=gameId, move=rng.choice(state["moves"]))
+        assert state["ok"], state
+        await asyncio.sleep(0) # let the other games take a turn
+    await client.request("close", game=gameId)
+
+async def runDemo(store, games, connections, maxMoves, port, instrumentation=None):
+    server = GameServer(store)
+    if instrumentation is not None:
+        instrumentation.watch("server", server.stats)
+    await server.start(port=port)
+    start = time.perf_counter()
+    async def worker(index):
+        client = GameClient()
+        await client.connect(port=port)
+        rng = random.Random(index)
+        for gameNumber in range(index, games, connections):
+            await playRandomGame(client, rng, maxMoves)
+        await client.close()
+    await asyncio.gather(*[worker(i) for i in range(connections)])
+    elapsed = time.perf_counter() - start
+    await server.close()
+    store = server.store
+    print("%d games, %d requests in %.2f s (%.0f requests/s), %d evictions, %d restores, %d expired" %
+          (games, server.requests, elapsed, server.requests / elapsed, store.evictions, store.restores, store.expired))
+
+async def serve(host, port, store, instrumentation=None):
+    server = GameServer(store)
+    if instrumentation is not None:
+        instrumentation.watch("server", server.stats)
+    await server.start(host, port)
+    print("serving on " + host + ":" + str(port), file=sys.stderr)
+    await server.server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Host many chess games behind a JSON socket protocol")
+    parser.add_argument("mode", choices=["serve", "demo"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--max-active", type=int, default=1000, help="games kept in memory, the rest are snapshots")
+    parser.add_argument("--idle-timeout", type=float, default=60.0, help="seconds before an idle game is evicted")
+    parser.add_argument("--max-snapshots", type=int, default=100000, help="evicted games kept, the oldest go first")
+    parser.add_argument("--snapshot-timeout", type=float, default=86400.0,
+                        help="seconds an evicted game is kept before it is dropped")
+    parser.add_argument("--games", type=int, default=200, help="demo: number of games to play")
+    parser.add_argument("--connections", type=int, default=50, help="demo: number of simultaneous clients")
+    parser.add_argument("--max-moves", type=int, default=40, help="demo: moves per game at most")
+    parser.add_argument("--profile", help="append instrumentation snapshots to this file as JSON lines")
+    parser.add_argument("--profile-interval", type=float, default=5.0, help="seconds between snapshots")
+    args = parser.parse_args()
+    store = GameStore(BACKENDS[args.backend], args.max_active, args.idle_timeout, args.max_snapshots,
+                      args.snapshot_timeout)
+    instrumentation = None
+    if args.profile:
+        instrumentation = Instrumentation().enable()
+        instrumentation.startDumping(args.profile, args.profile_interval)
+    try:
+        if args.mode == "serve":
+            asyncio.run(serve(args.host, args.port, store, instrumentation))
+        else:
+            asyncio.run(runDemo(store, args.games, args.connections, args.max_moves, args.port, instrumentation))
+    finally:
+        if instrumentation is not None:
+            instrumentation.stopDumping()
+            instrumentation.dump(args.profile)
+            instrumentation.disable()
+
+if __name__ == "__main__":
+    main()
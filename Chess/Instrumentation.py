@@ -0,0 +1,150 @@
+# opt-in instrumentation: call counts and time spent in the move generator, search statistics and frame times
+# methods are timed by replacing them on their class with a wrapper while instrumentation is enabled
+# and putting the original back when it is disabled, so a disabled build runs the untouched methods
+# figures of a subclass method include the base class method it calls, e.g. BitboardGameState.makeMove
+# contains GameState.makeMove; counts are updated without a lock and can miss a call or two across threads
+# run from the repository root: python Chess/Instrumentation.py --fen "..." --time 2
+import argparse
+import functools
+import json
+import sys
+import threading
+import time
+from ChessEngine import GameState, START_FEN
+from BitboardEngine import BitboardGameState, BACKENDS, DEFAULT_BACKEND
+from ChessSearch import Searcher
+
+GAME_STATE_METHODS = ["getValidMoves", "getAllPossibleMoves", "squareUnderAttack", "makeMove", "undoMove"]
+SEARCH_METHODS = ["findBestMove", "iterativeDeepening"]
+
+class Instrumentation():
+    def __init__(self):
+        self.counts = {} # "Class.method" -> calls
+        self.seconds = {} # "Class.method" -> seconds spent in the calls
+        self.patched = [] # (class, method name, original attribute) to put back on disable
+        self.sources = {} # name -> function returning a dict of figures for the snapshot
+        self.game = None
+        self.started = time.time()
+        self.frames = 0
+        self.frameSeconds = 0.0
+        self.slowestFrame = 0.0
+        self.dumpThread = None
+        self.dumpStop = threading.Event()
+
+    # wrap the methods a class defines itself, inherited ones are timed on the class that defines them
+    def instrument(self, cls, methodNames):
+        for name in methodNames:
+            if name in cls.__dict__:
+                original = cls.__dict__[name]
+                setattr(cls, name, self.timed(cls.__name__ + "." + name, original))
+                self.patched.append((cls, name, original))
+
+    # time the move generators of both backends and the search
+    def enable(self):
+        if not self.patched:
+            for cls in (GameState, BitboardGameState):
+                self.instrument(cls, GAME_STATE_METHODS)
+            self.instrument(Searcher, SEARCH_METHODS)
+        return self
+
+    # put the original methods back
+    def disable(self):
+        while self.patched:
+            cls, name, original = self.patched.pop()
+            setattr(cls, name, original)
+
+    def timed(self, label, function):
+        counts = self.counts
+        seconds = self.seconds
+        counts.setdefault(label, 0)
+        seconds.setdefault(label, 0.0)
+        clock = time.perf_counter
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counts[label] += 1
+                seconds[label] += clock() - start
+        return wrapper
+
+    # include function()'s figures in every snapshot under name, e.g. a searcher's stats()
+    def watch(self, name, function):
+        self.sources[name] = function
+
+    def recordFrame(self, seconds):
+        self.frames += 1
+        self.frameSeconds += seconds
+        if seconds > self.slowestFrame:
+            self.slowestFrame = seconds
+
+    # start counting from zero, for a new game if game is given
+    def reset(self, game=None):
+        for label in self.counts:
+            self.counts[label] = 0
+            self.seconds[label] = 0.0
+        self.game = game
+        self.started = time.time()
+        self.frames = 0
+        self.frameSeconds = 0.0
+        self.slowestFrame = 0.0
+
+    # JSON friendly dict of everything counted since the last reset
+    def snapshot(self):
+        calls = {}
+        for label in sorted(self.counts):
+            count = self.counts[label]
+            seconds = self.seconds[label]
+            calls[label] = {"count": count, "seconds": round(seconds, 6),
+                            "microsecondsPerCall": round(seconds / count * 1e6, 3) if count else 0.0}
+        snapshot = {"time": time.time(), "elapsed": round(time.time() - self.started, 3), "game": self.game,
+                    "calls": calls,
+                    "frames": {"count": self.frames,
+                               "meanMilliseconds": round(self.frameSeconds / self.frames * 1e3, 3) if self.frames else 0.0,
+                               "slowestMilliseconds": round(self.slowestFrame * 1e3, 3)}}
+        for name, function in self.sources.items():
+            snapshot[name] = function()
+        return snapshot
+
+    # append a snapshot to path as one JSON line, so the file keeps the history of every game
+    def dump(self, path):
+        with open(path, "a") as dumpFile:
+            dumpFile.write(json.dumps(self.snapshot(), separators=(",", ":")) + "\n")
+
+    # dump to path every interval seconds on a background thread, until stopDumping
+    def startDumping(self, path, interval=5.0):
+        self.stopDumping()
+        self.dumpStop.clear()
+        def run():
+            while not self.dumpStop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as error:
+                    print("instrumentation dump failed: " + str(error), file=sys.stderr)
+        self.dumpThread = threading.Thread(target=run, daemon=True)
+        self.dumpThread.start()
+
+    def stopDumping(self):
+        if self.dumpThread is not None:
+            self.dumpStop.set()
+            self.dumpThread.join()
+            self.dumpThread = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a position with instrumentation enabled and print the figures")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--time", type=float, default=2.0, help="seconds to search")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    args = parser.parse_args()
+    instrumentation = Instrumentation().enable()
+    searcher = Searcher()
+    instrumentation.watch("search", searcher.stats)
+    gs = BACKENDS[args.backend].fromFen(args.fen)
+    searcher.findBestMove(gs, timeLimit=args.time)
+    instrumentation.disable()
+    json.dump(instrumentation.snapshot(), sys.stdout, indent=1)
+    print()
+
+if __name__ == "__main__":
+    main()
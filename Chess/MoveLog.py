@@ -0,0 +1,193 @@
+# buffered move log shared by the games running in one process
+# lines are collected in memory and written by a background thread every flushInterval seconds,
+# so making a move never touches the disk
+# formats: "text" (one line per move), "jsonl" (one JSON object per move or game event), "pgn" (one record per game)
+# the file is rotated to path.1, path.2, ... when it would grow past maxBytes
+# give every process its own path, rotation is not coordinated between processes
+import datetime
+import itertools
+import json
+import os
+import threading
+
+FORMATS = ("text", "jsonl", "pgn")
+
+# standard algebraic notation of a valid move, without check marks
+def moveToSan(move, validMoves):
+    if move.isCastleMove:
+        return "O-O" if move.endCol > move.startCol else "O-O-O"
+    target = move.getRankFiles(move.endRow, move.endCol)
+    piece = move.pieceMoved[1]
+    capture = "x" if move.pieceCaptured != "--" or move.isEnpassantMove else ""
+    if piece == "P":
+        san = (move.getRankFiles(move.startRow, move.startCol)[0] if capture else "") + capture + target
+        return san + "=Q" if move.isPawnPromotion else san
+    # other pieces of the same kind that can reach the target square
+    rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and
+              other.endCol == move.endCol and (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+    origin = move.getRankFiles(move.startRow, move.startCol)
+    if not rivals:
+        disambiguation = ""
+    elif all(other.startCol != move.startCol for other in rivals):
+        disambiguation = origin[0]
+    elif all(other.startRow != move.startRow for other in rivals):
+        disambiguation = origin[1]
+    else:
+        disambiguation = origin
+    return piece + disambiguation + capture + target
+
+class MoveLog():
+    def __init__(self, path="Chess/logs.txt", format="text", maxBytes=1 << 20, backupCount=3,
+                 flushInterval=1.0, bufferSize=256):
+        if format not in FORMATS:
+            raise ValueError("unknown log format: " + format)
+        self.path = path
+        self.format = format
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.flushInterval = flushInterval
+        self.bufferSize = bufferSize # flush early when this many lines are waiting
+        self.buffer = []
+        self.games = {} # gameId -> {"headers": ..., "moves": [san, ...]} for the games in progress
+        self.gameIds = itertools.count(1)
+        self.lock = threading.Lock()
+        self.wakeUp = threading.Event()
+        self.closed = False
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    # start a game and return its id, unique among the processes on this host
+    def newGame(self, headers=None):
+        gameId = "%d-%d" % (os.getpid(), next(self.gameIds))
+        game = {"headers": dict(headers or {}), "moves": [], "start": datetime.datetime.now()}
+        with self.lock:
+            self.games[gameId] = game
+        self.write(gameId, {"event": "start", "headers": game["headers"]}, game["start"])
+        return gameId
+
+    # san can be left out for the text and jsonl formats
+    def logMove(self, gameId, move, san=None):
+        now = datetime.datetime.now()
+        with self.lock:
+            game = self.games.get(gameId)
+            if game is not None:
+                game["moves"].append(san or move.getChessNotation())
+        self.write(gameId, {"event": "move", "move": move.getChessNotation(), "san": san}, now)
+
+    def undoMove(self, gameId):
+        with self.lock:
+            game = self.games.get(gameId)
+            if game is not None and game["moves"]:
+                game["moves"].pop()
+        self.write(gameId, {"event": "undo"}, datetime.datetime.now())
+
+    # finish a game, result is "1-0", "0-1", "1/2-1/2" or "*"
+    def endGame(self, gameId, result="*"):
+        now = datetime.datetime.now()
+        with self.lock:
+            game = self.games.pop(gameId, None)
+        if game is None:
+            return
+        if self.format == "pgn":
+            self.append(self.pgnRecord(gameId, game, result))
+        else:
+            self.write(gameId, {"event": "end", "result": result}, now)
+
+    def write(self, gameId, entry, now):
+        if self.format == "jsonl":
+            entry = dict(entry, game=gameId, time=now.isoformat(timespec="milliseconds"))
+            self.append(json.dumps(entry, separators=(",", ":")) + "\n")
+        elif self.format == "text" and entry["event"] != "start":
+            text = entry.get("move") or entry.get("result") or entry["event"]
+            self.append(now.strftime("%Y-%m-%d %H:%M:%S") + " " + gameId + " " + text + "\n")
+
+    def pgnRecord(self, gameId, game, result):
+        start = game["start"]
+        headers = {"Event": "Casual game", "Site": "?", "Date": start.strftime("%Y.%m.%d"), "Round": "-",
+                   "White": "?", "Black": "?", "Result": result}
+        headers.update(game["headers"])
+        if "FEN" in headers:
+            headers["SetUp"] = "1"
+        headers["Result"] = result
+        headers["GameId"] = gameId
+        headers["StartTime"] = start.isoformat(timespec="seconds")
+        headers["EndTime"] = datetime.datetime.now().isoformat(timespec="seconds")
+        lines = ['[%s "%s"]' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                 for name, value in headers.items()]
+        # the move numbers count from the position the game started in
+        fields = headers.get("FEN", "w 1").split()
+        number = int(fields[-1]) if fields[-1].isdigit() else 1
+        whiteToMove = fields[1] != "b" if len(fields) > 1 else True
+        tokens = []
+        for san in game["moves"]:
+            if whiteToMove:
+                tokens.append(str(number) + ".")
+            elif not tokens:
+                tokens.append(str(number) + "...")
+            tokens.append(san)
+            if not whiteToMove:
+                number += 1
+            whiteToMove = not whiteToMove
+        tokens.append(result)
+        movetext = []
+        line = ""
+        for token in tokens: # PGN lines stay under 80 characters
+            if line and len(line) + len(token) >= 80:
+                movetext.append(line)
+                line = ""
+            line = line + " " + token if line else token
+        movetext.append(line)
+        return "\n".join(lines) + "\n\n" + "\n".join(movetext) + "\n\n"
+
+    def append(self, text):
+        with self.lock:
+            self.buffer.append(text)
+            full = len(self.buffer) >= self.bufferSize
+        if full:
+            self.wakeUp.set()
+
+    # write out everything buffered so far
+    def flush(self):
+        with self.lock:
+            text = "".join(self.buffer)
+            self.buffer = []
+        if not text:
+            return
+        data = text.encode("utf-8")
+        try:
+            if self.maxBytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.maxBytes:
+                self.rotate()
+            with open(self.path, "ab") as logFile:
+                logFile.write(data)
+        except OSError:
+            with self.lock: # keep the lines for the next try
+                self.buffer.insert(0, text)
+            raise
+
+    # path -> path.1 -> path.2 ... the oldest one past backupCount is dropped
+    def rotate(self):
+        for i in range(self.backupCount - 1, 0, -1):
+            if os.path.exists(self.path + "." + str(i)):
+                os.replace(self.path + "." + str(i), self.path + "." + str(i + 1))
+        if self.backupCount > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def run(self):
+        while not self.closed:
+            self.wakeUp.wait(self.flushInterval)
+            self.wakeUp.clear()
+            try:
+                self.flush()
+            except OSError: # a full or missing disk must not take the games down
+                pass
+
+    # end the unfinished games and write out the rest of the buffer
+    def close(self):
+        for gameId in list(self.games):
+            self.endGame(gameId)
+        self.closed = True
+        self.wakeUp.set()
+        self.writer.join()
+        self.flush()
@@ -0,0 +1,137 @@
+# opening book: the moves played in the first plies of a PGN collection, keyed by zobrist key
+# the file is a header followed by fixed size (key, moveID, weight) records sorted by key
+# lookups memory-map the file and binary search it, so nothing is loaded up front and processes
+# using the same book share it through the page cache
+# run from the repository root: python Chess/OpeningBook.py build games.pgn -o Chess/book.bin
+import argparse
+import mmap
+import random
+import struct
+import sys
+from ChessEngine import GameState, MoveList, START_FEN
+from BatchAnalysis import readPgn, sanMoves, sanToMove
+
+MAGIC = b"LGBOOK01"
+HEADER = struct.Struct("<8sQ") # magic, number of records
+RECORD = struct.Struct("<QHH") # zobrist key, move as startSquare * 64 + endSquare, weight
+MAX_WEIGHT = 0xFFFF
+
+# moveIDs don't fit in 16 bits, squares numbered 0-63 do
+def packMove(moveID):
+    return (moveID // 10000 * 8 + moveID // 100 % 10) * 64 + moveID // 10 % 10 * 8 + moveID % 10
+
+def unpackMove(packed):
+    start, end = packed // 64, packed % 64
+    return start // 8 * 10000 + start % 8 * 100 + end // 8 * 10 + end % 8
+
+# count the moves played from every position in the first maxPly plies of the games
+# returns {(key, moveID): times played}
+def collectMoves(paths, maxPly=20, counts=None):
+    if counts is None:
+        counts = {}
+    for path in paths:
+        for headers, movetext in readPgn(path):
+            try:
+                gs = GameState.fromFen(headers.get("FEN", START_FEN))
+                for san in sanMoves(movetext)[:maxPly]:
+                    move = sanToMove(san, gs.getValidMoves())
+                    entry = (gs.zobristKey, move.moveID)
+                    counts[entry] = counts.get(entry, 0) + 1
+                    gs.makeMove(move)
+            except ValueError: # keep the moves before an unreadable one, skip a game with a bad FEN
+                pass
+    return counts
+
+# write the counted moves as a book file, dropping moves played fewer than minCount times
+# returns the number of records written
+def writeBook(counts, path, minCount=1):
+    records = sorted((key, packMove(moveID), min(count, MAX_WEIGHT)) for (key, moveID), count in counts.items()
+                     if count >= minCount)
+    with open(path, "wb") as bookFile:
+        bookFile.write(HEADER.pack(MAGIC, len(records)))
+        for record in records:
+            bookFile.write(RECORD.pack(*record))
+    return len(records)
+
+class OpeningBook():
+    def __init__(self, path):
+        self.bookFile = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.bookFile.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # an empty file cannot be mapped
+            self.bookFile.close()
+            raise ValueError("not an opening book: " + path)
+        magic, self.size = HEADER.unpack_from(self.data, 0) if len(self.data) >= HEADER.size else (None, 0)
+        if magic != MAGIC or len(self.data) != HEADER.size + self.size * RECORD.size:
+            self.close()
+            raise ValueError("not an opening book: " + path)
+
+    # [(moveID, weight), ...] stored for the position with this key
+    def lookup(self, key):
+        low = 0
+        high = self.size
+        while low < high: # first record with a key >= the one we want
+            middle = (low + high) // 2
+            if RECORD.unpack_from(self.data, HEADER.size + middle * RECORD.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        entries = []
+        for index in range(low, self.size):
+            recordKey, packed, weight = RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+            if recordKey != key:
+                break
+            entries.append((unpackMove(packed), weight))
+        return entries
+
+    # [(move, weight), ...] for the book moves that are valid in gs, a key collision can't produce an invalid move
+    def getMoves(self, gs, validMoves=None):
+        entries = self.lookup(gs.zobristKey)
+        if not entries:
+            return []
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        elif not isinstance(validMoves, MoveList):
+            validMoves = MoveList(validMoves)
+        moves = []
+        for moveID, weight in entries:
+            move = validMoves.getMove(moveID)
+            if move is not None:
+                moves.append((move, weight))
+        return moves
+
+    # a book move picked at random in proportion to how often it was played, or None if the position is not in the book
+    def pickMove(self, gs, validMoves=None, rng=random):
+        moves = self.getMoves(gs, validMoves)
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+    def close(self):
+        self.data.close()
+        self.bookFile.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query an opening book")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    build = subparsers.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+", help="PGN files, optionally gzip compressed")
+    build.add_argument("-o", "--output", default="Chess/book.bin")
+    build.add_argument("--plies", type=int, default=20, help="number of plies of every game to include")
+    build.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times")
+    probe = subparsers.add_parser("probe", help="list the book moves of a position")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args()
+    if args.mode == "build":
+        counts = collectMoves(args.pgn, args.plies)
+        records = writeBook(counts, args.output, args.min_count)
+        print("%d records written to %s" % (records, args.output), file=sys.stderr)
+    else:
+        book = OpeningBook(args.book)
+        for move, weight in sorted(book.getMoves(GameState.fromFen(args.fen)), key=lambda entry: -entry[1]):
+            print(move.getChessNotation() + " " + str(weight))
+        book.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# splits the root moves of perft and search across a pool of worker processes
+# positions travel to the workers as GameState.snapshot() tuples and the results are merged here
+# run from the repository root: python Chess/ParallelSearch.py perft --depth 4
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from ChessSearch import Searcher, MAX_DEPTH
+from BitboardEngine import BACKENDS, DEFAULT_BACKEND
+import Perft
+
+# worker: perft below one root move
+def perftRootMove(backend, snapshot, moveID, depth):
+    gs = backend.fromSnapshot(snapshot)
+    for move in gs.getValidMoves():
+        if move.moveID == moveID:
+            gs.makeMove(move)
+            return Perft.perft(gs, depth - 1)
+    raise ValueError("move " + str(moveID) + " is not valid in the snapshot position")
+
+# worker: iterative deepening over a share of the root moves
+# returns (depth, score, moveID) for every depth it finished
+def searchRootMoves(backend, snapshot, moveIDs, timeLimit, maxDepth):
+    gs = backend.fromSnapshot(snapshot)
+    moves = [move for move in gs.getValidMoves() if move.moveID in moveIDs]
+    iterations = Searcher().iterativeDeepening(gs, moves, timeLimit, maxDepth)
+    return [(depth, score, move.moveID) for depth, score, move in iterations]
+
+# perft with one task per root move, returns (total nodes, {move notation: nodes})
+def parallelPerft(gs, depth, executor=None, workers=None):
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return parallelPerft(gs, depth, executor)
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return (len(moves) if depth == 1 else 1), {move.getChessNotation(): 1 for move in moves}
+    snapshot = gs.snapshot()
+    futures = [executor.submit(perftRootMove, type(gs), snapshot, move.moveID, depth) for move in moves]
+    counts = {move.getChessNotation(): future.result() for move, future in zip(moves, futures)}
+    return sum(counts.values()), counts
+
+# root-split search: every worker searches its share of the root moves for timeLimit seconds
+# the merged result is the best move at the deepest depth every worker finished
+def parallelFindBestMove(gs, validMoves=None, timeLimit=1.0, maxDepth=MAX_DEPTH, executor=None, workers=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    if len(validMoves) <= 1:
+        return validMoves[0] if validMoves else None
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return parallelFindBestMove(gs, validMoves, timeLimit, maxDepth, executor, workers)
+    workers = min(workers or os.cpu_count(), len(validMoves))
+    shares = [[move.moveID for move in validMoves[i::workers]] for i in range(workers)] # deal moves like cards
+    snapshot = gs.snapshot()
+    futures = [executor.submit(searchRootMoves, type(gs), snapshot, share, timeLimit, maxDepth) for share in shares]
+    results = [future.result() for future in futures]
+    if any(len(iterations) == 0 for iterations in results): # a worker did not finish depth 1
+        return validMoves[0]
+    depth = min(iterations[-1][0] for iterations in results)
+    best = max((iterations[depth - 1] for iterations in results), key=lambda iteration: iteration[1])
+    for move in validMoves:
+        if move.moveID == best[2]:
+            return move
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft and search split across processes")
+    parser.add_argument("mode", choices=["perft", "search"])
+    parser.add_argument("--depth", type=int, help="perft depth (4 by default) or deepest search depth")
+    parser.add_argument("--time", type=float, default=5.0, help="search time in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--fen", help="position to search, the start position by default")
+    args = parser.parse_args()
+    backend = BACKENDS[args.backend]
+    with ProcessPoolExecutor(args.workers) as executor:
+        if args.mode == "perft":
+            if args.fen:
+                total, counts = parallelPerft(backend.fromFen(args.fen), args.depth or 4, executor)
+                for notation in sorted(counts):
+                    print(notation + ": " + str(counts[notation]))
+                print("moves: " + str(len(counts)) + "  nodes: " + str(total))
+            elif not Perft.runBenchmark(args.depth or 4, backend,
+                                        perftFunction=lambda gs, depth: parallelPerft(gs, depth, executor)[0]):
+                print("perft counts differ from the known values")
+                sys.exit(1)
+        else:
+            gs = backend.fromFen(args.fen) if args.fen else backend()
+            move = parallelFindBestMove(gs, timeLimit=args.time, maxDepth=args.depth or MAX_DEPTH,
+                                        executor=executor, workers=args.workers)
+            print(move.getChessNotation() if move is not None else "no valid moves")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# perft counts the leaf nodes of the move tree to a fixed depth
+# it checks the move generator against known counts and measures its speed
+# run from the repository root: python Chess/Perft.py --depth 3
+import argparse
+import sys
+import time
+import tracemalloc
+from ChessEngine import GameState, START_FEN
+from BitboardEngine import BACKENDS, DEFAULT_BACKEND
+import Epd
+
+# standard perft positions with their known node counts for depth 1, 2, 3, ...
+# the engine always promotes to a queen, so only depths without promotions in the tree are listed
+PERFT_POSITIONS = [
+    ("start", START_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+# number of leaf nodes depth moves away from the current position
+def perft(gs, depth):
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+# perft split by root move, for finding which move a wrong count comes from
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+def printDivide(gs, depth):
+    counts = divide(gs, depth)
+    for notation in sorted(counts):
+        print(notation + ": " + str(counts[notation]))
+    print("moves: " + str(len(counts)) + "  nodes: " + str(sum(counts.values())))
+
+# runs every position up to maxDepth, prints the results and returns False if any count is wrong
+def runBenchmark(maxDepth, backend=GameState, traceMemory=False, positions=PERFT_POSITIONS, perftFunction=perft):
+    passed = True
+    totalNodes = 0
+    totalTime = 0
+    print("%-10s %5s %10s %10s %8s %10s %10s" % ("position", "depth", "nodes", "expected", "seconds", "nodes/s", "peak KiB"))
+    for name, fen, expected in positions:
+        for depth in range(1, min(maxDepth, len(expected)) + 1):
+            gs = backend.fromFen(fen)
+            start = time.perf_counter()
+            nodes = perftFunction(gs, depth)
+            elapsed = time.perf_counter() - start
+            peak = "-"
+            if traceMemory: # traced separately so it does not slow down the timed run
+                gs = backend.fromFen(fen)
+                tracemalloc.start()
+                perftFunction(gs, depth)
+                peak = str(tracemalloc.get_traced_memory()[1] // 1024)
+                tracemalloc.stop()
+            totalNodes += nodes
+            totalTime += elapsed
+            status = "" if nodes == expected[depth - 1] else "  MISMATCH"
+            if status:
+                passed = False
+            print("%-10s %5d %10d %10d %8.3f %10.0f %10s%s" % (name, depth, nodes, expected[depth - 1], elapsed,
+                                                             nodes / elapsed if elapsed else 0, peak, status))
+    print("total: %d nodes in %.3f s, %.0f nodes/s" % (totalNodes, totalTime, totalNodes / totalTime if totalTime else 0))
+    return passed
+
+# runs a perft suite in EPD form, with the expected counts as "D1 20; D2 400" operations
+def runEpdSuite(path, maxDepth, backend=GameState):
+    passed = True
+    positions = 0
+    for gs, operations in Epd.readEpd(path, backend):
+        positions += 1
+        fen = gs.toFen()
+        for depth in range(1, maxDepth + 1):
+            expected = operations.get("D" + str(depth))
+            if expected is None:
+                break
+            nodes = perft(gs, depth)
+            if nodes != int(expected):
+                passed = False
+                print("MISMATCH %s depth %d: %d nodes, expected %s" % (fen, depth, nodes, expected))
+    print("%d positions checked" % positions)
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft correctness and speed benchmark")
+    parser.add_argument("--depth", type=int, default=3, help="deepest depth to run for each position")
+    parser.add_argument("--backend", choices=sorted(BACKENDS) + ["all"], default=DEFAULT_BACKEND,
+                        help="all runs every backend one after the other, to compare their speed")
+    parser.add_argument("--fen", help="run divide on this position instead of the benchmark")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--epd", help="run a perft suite file with D1, D2, ... operations")
+    parser.add_argument("--memory", action="store_true", help="also report peak memory with tracemalloc")
+    args = parser.parse_args()
+    names = sorted(BACKENDS) if args.backend == "all" else [args.backend]
+    passed = True
+    for name in names:
+        backend = BACKENDS[name]
+        if len(names) > 1:
+            print("backend: " + name)
+        if args.fen or args.divide:
+            printDivide(backend.fromFen(args.fen or START_FEN), args.depth)
+        elif args.epd:
+            passed = runEpdSuite(args.epd, args.depth, backend) and passed
+        else:
+            passed = runBenchmark(args.depth, backend, args.memory) and passed
+    if not passed:
+        print("perft counts differ from the known values")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
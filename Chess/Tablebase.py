@@ -0,0 +1,377 @@
+# endgame tablebases for positions with up to four pieces, kings included
+# a table holds one byte per (piece squares, side to move) for one material signature such as "KQvK":
+#   0 draw, 255 illegal position, otherwise plies to mate + 1, an odd number of plies meaning the side to move wins
+# tables are generated by retrograde analysis over the GameState move rules: every position's moves are found once,
+# split across worker processes, then results spread backwards from the mates one ply at a time
+# castling is never possible and en passant rights are not part of the index
+# cost: the workers take about 120 µs of CPU per position, a minute for a three-piece table and over an hour
+# for a four-piece one (2 * 64 ** 4 positions); the main process then needs about 11 bytes of memory per position,
+# 0.4 GB for four pieces, and runs two pure Python passes over every non-capturing move that take some minutes
+# the moves are kept in temporary files next to the table, 8 bytes of disk per non-capturing move
+# run from the repository root: python Chess/Tablebase.py generate KQvK KRvK KPvK --workers 4
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from ChessEngine import GameState, CastleRights
+
+MAGIC = b"LGTB0001"
+HEADER = struct.Struct("<8s16s") # magic, signature
+MAX_PIECES = 4
+PIECE_ORDER = "KQRBNP"
+DRAW = 0
+ILLEGAL = 255
+MAX_PLIES = 253
+
+# position status found by the worker processes
+NORMAL = 0
+INVALID = 1
+MATED = 2
+STALEMATED = 3
+
+# "KQvK" -> ["wK", "bK", "wQ"], the order piece squares take in the table index
+def signaturePieces(signature):
+    white, black = signature.split("v")
+    if white[:1] != "K" or black[:1] != "K" or len(white) + len(black) > MAX_PIECES or \
+            any(letter not in PIECE_ORDER[1:] for letter in white[1:] + black[1:]):
+        raise ValueError("not a signature of up to " + str(MAX_PIECES) + " pieces: " + signature)
+    return ["wK", "bK"] + ["w" + letter for letter in white[1:]] + ["b" + letter for letter in black[1:]]
+
+def sortedPieces(letters):
+    return "".join(sorted(letters, key=PIECE_ORDER.index))
+
+# signature of the material on a board, None with more than MAX_PIECES pieces
+def boardSignature(board):
+    white = ""
+    black = ""
+    for row in board:
+        for square in row:
+            if square[0] == "w":
+                white += square[1]
+            elif square[0] == "b":
+                black += square[1]
+    if len(white) + len(black) > MAX_PIECES:
+        return None
+    return sortedPieces(white) + "v" + sortedPieces(black)
+
+# signatures a capture or a promotion can lead to
+def successorSignatures(signature):
+    white, black = signature.split("v")
+    successors = set()
+    for i in range(1, len(white)):
+        successors.add(sortedPieces(white[:i] + white[i + 1:]) + "v" + black)
+        if white[i] == "P":
+            successors.add(sortedPieces(white[:i] + "Q" + white[i + 1:]) + "v" + black)
+    for i in range(1, len(black)):
+        successors.add(white + "v" + sortedPieces(black[:i] + black[i + 1:]))
+        if black[i] == "P":
+            successors.add(white + "v" + sortedPieces(black[:i] + "Q" + black[i + 1:]))
+    return successors
+
+# squares 0-63 of the pieces in signature order and the side to move -> table index
+# the white king's square is the most significant digit, so one white king square is one contiguous chunk
+def tableIndex(squares, whiteToMove):
+    index = 0
+    for square in squares:
+        index = index * 64 + square
+    return index * 2 + (0 if whiteToMove else 1)
+
+def tablePath(directory, signature):
+    return os.path.join(directory, signature + ".tb")
+
+# read-only access to the tables in a directory, each one memory-mapped on first use
+class Tablebase():
+    def __init__(self, directory="Chess/tablebases"):
+        self.directory = directory
+        self.tables = {} # signature -> mmap, or None if there is no table for it
+
+    def getTable(self, signature):
+        if signature not in self.tables:
+            table = None
+            path = tablePath(self.directory, signature)
+            if os.path.exists(path):
+                with open(path, "rb") as tableFile:
+                    table = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, stored = HEADER.unpack_from(table, 0)
+                if magic != MAGIC or stored.rstrip(b"\0").decode() != signature:
+                    table.close()
+                    raise ValueError("not a tablebase for " + signature + ": " + path)
+            self.tables[signature] = table
+        return self.tables[signature]
+
+    # the table byte of the position, or None if it is not covered
+    def probeValue(self, gs):
+        signature = boardSignature(gs.board)
+        if signature is None:
+            return None
+        if signature == "KvK":
+            return DRAW
+        table = self.getTable(signature)
+        if table is None:
+            return None
+        squares = {}
+        for r in range(8):
+            for c in range(8):
+                if gs.board[r][c] != "--":
+                    squares.setdefault(gs.board[r][c], []).append(r * 8 + c)
+        order = [squares[piece].pop() for piece in signaturePieces(signature)]
+        return table[HEADER.size + tableIndex(order, gs.whiteToMove)]
+
+    # ("win" / "loss" / "draw", plies to mate) for the side to move, or None if the position is not covered
+    def probe(self, gs):
+        value = self.probeValue(gs)
+        if value is None or value == ILLEGAL:
+            return None
+        if value == DRAW:
+            return ("draw", 0)
+        plies = value - 1
+        return ("win" if plies % 2 else "loss", plies)
+
+    # the move that wins fastest, draws, or loses slowest, or None if the position is not covered
+    def bestMove(self, gs, validMoves=None):
+        if self.probeValue(gs) is None:
+            return None
+        if validMoves is None:
+            validMoves = gs.getValidMoves()
+        checkmate, stalemate, draw = gs.checkmate, gs.stalemate, gs.draw
+        bestMove = None
+        bestScore = None
+        for move in validMoves:
+            gs.makeMove(move)
+            value = self.probeValue(gs) # from the opponent's point of view
+            gs.undoMove()
+            if value is None or value == ILLEGAL:
+                continue
+            if value == DRAW:
+                score = 0
+            elif (value - 1) % 2 == 0: # the opponent gets mated
+                score = 1000 - value
+            else:
+                score = -1000 + value
+            if bestScore is None or score > bestScore:
+                bestMove = move
+                bestScore = score
+        gs.checkmate, gs.stalemate, gs.draw = checkmate, stalemate, draw
+        return bestMove
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table.close()
+        self.tables = {}
+
+# worker: status and moves of every position with the white king on whiteKing
+# returns (status, number of moves staying in the table, best exit win, worst exit loss, drawing exits)
+# and writes the table indexes those moves lead to into a temporary file, four piece tables have hundreds
+# of millions of them
+# exits are captures and promotions, which leave the table and are looked up in the smaller tables
+def analyzeChunk(signature, whiteKing, directory):
+    pieces = signaturePieces(signature)
+    count = 64 ** (len(pieces) - 1)
+    chunkSize = count * 2
+    status = bytearray(chunkSize)
+    moveCounts = bytearray(chunkSize)
+    successors = array("I")
+    exitWin = bytearray([ILLEGAL]) * chunkSize # fewest plies to an exit where the opponent is mated
+    exitLoss = bytearray(chunkSize) # most plies + 1 to an exit where the opponent mates
+    exitDraw = bytearray(chunkSize)
+    tablebase = Tablebase(directory)
+    noCastling = CastleRights(False, False, False, False)
+    gs = GameState()
+    for rest in range(count):
+        squares = [whiteKing]
+        digits = rest
+        for i in range(len(pieces) - 1):
+            squares.insert(1, digits % 64)
+            digits //= 64
+        board = None
+        if len(set(squares)) == len(squares) and \
+                all(piece[1] != "P" or 8 <= square < 56 for piece, square in zip(pieces, squares)):
+            board = [["--"] * 8 for r in range(8)]
+            for piece, square in zip(pieces, squares):
+                board[square // 8][square % 8] = piece
+        for whiteToMove in (True, False):
+            local = rest * 2 + (0 if whiteToMove else 1)
+            if board is None:
+                status[local] = INVALID
+                continue
+            gs.loadPosition(board, whiteToMove, noCastling, ())
+            gs.whiteToMove = not whiteToMove # the side that just moved can't be left in check
+            invalid = gs.inCheck()
+            gs.whiteToMove = whiteToMove
+            if invalid:
+                status[local] = INVALID
+                continue
+            moves = gs.getValidMoves()
+            if len(moves) == 0:
+                status[local] = MATED if gs.checkmate else STALEMATED
+            for move in moves:
+                if move.pieceCaptured != "--" or move.isPawnPromotion:
+                    gs.makeMove(move)
+                    value = tablebase.probeValue(gs)
+                    gs.undoMove()
+                    if value is None or value == DRAW:
+                        exitDraw[local] = 1
+                    elif (value - 1) % 2 == 0: # the opponent is mated
+                        exitWin[local] = min(exitWin[local], value - 1)
+                    else:
+                        exitLoss[local] = max(exitLoss[local], value)
+                else:
+                    moved = squares[:]
+                    moved[squares.index(move.startRow * 8 + move.startCol)] = move.endRow * 8 + move.endCol
+                    successors.append(tableIndex(moved, not whiteToMove))
+                    moveCounts[local] += 1
+    with open(chunkPath(directory, signature, whiteKing), "wb") as chunkFile:
+        successors.tofile(chunkFile)
+    return whiteKing, bytes(status), bytes(moveCounts), bytes(exitWin), bytes(exitLoss), bytes(exitDraw)
+
+def chunkPath(directory, signature, whiteKing):
+    return os.path.join(directory, signature + "." + str(whiteKing) + ".tmp")
+
+def readChunk(directory, signature, whiteKing):
+    successors = array("I")
+    with open(chunkPath(directory, signature, whiteKing), "rb") as chunkFile:
+        successors.frombytes(chunkFile.read())
+    return successors
+
+# generate the table for signature, and first the smaller tables it depends on, skipping tables already on disk
+def generate(signature, directory="Chess/tablebases", executor=None, workers=None, log=sys.stderr):
+    if executor is None:
+        with ProcessPoolExecutor(workers) as executor:
+            return generate(signature, directory, executor, workers, log)
+    signaturePieces(signature) # check it
+    if os.path.exists(tablePath(directory, signature)) or signature == "KvK":
+        return
+    for successor in sorted(successorSignatures(signature)):
+        generate(successor, directory, executor, workers, log)
+    os.makedirs(directory, exist_ok=True)
+    pieces = signaturePieces(signature)
+    size = 2 * 64 ** len(pieces)
+    chunkSize = size // 64
+    status = bytearray(size)
+    moveCounts = bytearray(size)
+    exitWin = bytearray(size)
+    exitLoss = bytearray(size)
+    exitDraw = bytearray(size)
+    futures = [executor.submit(analyzeChunk, signature, whiteKing, directory) for whiteKing in range(64)]
+    for future in futures:
+        whiteKing, chunkStatus, chunkCounts, chunkWin, chunkLoss, chunkDraw = future.result()
+        start = whiteKing * chunkSize
+        status[start:start + chunkSize] = chunkStatus
+        moveCounts[start:start + chunkSize] = chunkCounts
+        exitWin[start:start + chunkSize] = chunkWin
+        exitLoss[start:start + chunkSize] = chunkLoss
+        exitDraw[start:start + chunkSize] = chunkDraw
+    predecessorPath = os.path.join(directory, signature + ".predecessors.tmp")
+    try:
+        with open(predecessorPath, "w+b") as predecessorFile:
+            predecessorOffsets, predecessors = findPredecessors(size, moveCounts, directory, signature, predecessorFile)
+        values = resolve(size, status, moveCounts, predecessorOffsets, predecessors, exitWin, exitLoss, exitDraw)
+        del predecessorOffsets, predecessors # unmaps the file
+    finally:
+        for whiteKing in range(64):
+            if os.path.exists(chunkPath(directory, signature, whiteKing)):
+                os.remove(chunkPath(directory, signature, whiteKing))
+        if os.path.exists(predecessorPath):
+            os.remove(predecessorPath)
+    path = tablePath(directory, signature)
+    with open(path + ".tmp", "wb") as tableFile:
+        tableFile.write(HEADER.pack(MAGIC, signature.encode()))
+        tableFile.write(values)
+    os.replace(path + ".tmp", path)
+    if log is not None:
+        decided = sum(1 for value in values if value != DRAW and value != ILLEGAL)
+        print("%s: %d positions, %d decided, longest mate %d plies" %
+              (signature, size, decided, max([value - 1 for value in values if value != ILLEGAL] or [0])), file=log)
+
+# the positions that can move to each position, read back chunk by chunk from the worker files
+# returns (offsets, flat array), predecessors of index are flat[offsets[index]:offsets[index + 1]]
+# the flat array is written into predecessorFile and mapped, so only the offsets are held in memory
+def findPredecessors(size, moveCounts, directory, signature, predecessorFile):
+    chunkSize = size // 64
+    # predecessorOffsets[successor + 2] counts first, the running sums then make predecessorOffsets[successor + 1]
+    # the start of successor's list, which moves on to its end as the list is filled
+    predecessorOffsets = array("I", [0]) * (size + 2)
+    for whiteKing in range(64):
+        for successor in readChunk(directory, signature, whiteKing):
+            predecessorOffsets[successor + 2] += 1
+    for index in range(size + 1):
+        predecessorOffsets[index + 1] += predecessorOffsets[index]
+    predecessorFile.truncate(max(predecessorOffsets[size + 1], 1) * 4)
+    predecessors = memoryview(mmap.mmap(predecessorFile.fileno(), 0)).cast("I")
+    for whiteKing in range(64):
+        successors = readChunk(directory, signature, whiteKing)
+        first = 0
+        for index in range(whiteKing * chunkSize, (whiteKing + 1) * chunkSize):
+            for successor in successors[first:first + moveCounts[index]]:
+                predecessors[predecessorOffsets[successor + 1]] = index
+                predecessorOffsets[successor + 1] += 1
+            first += moveCounts[index]
+    return predecessorOffsets, predecessors
+
+# spread the results back from the mates, one ply at a time
+def resolve(size, status, moveCounts, predecessorOffsets, predecessors, exitWin, exitLoss, exitDraw):
+    values = bytearray(size)
+    resolved = bytearray(size)
+    remaining = moveCounts # moves not yet known to lose, counted down in place
+    levels = [array("I") for plies in range(MAX_PLIES + 2)] # positions that may be decided in this many plies
+    for index in range(size):
+        if status[index] == INVALID:
+            values[index] = ILLEGAL
+            resolved[index] = 1
+        elif status[index] == MATED:
+            levels[0].append(index)
+        elif status[index] == STALEMATED:
+            resolved[index] = 1
+        else:
+            if exitWin[index] != ILLEGAL:
+                levels[exitWin[index] + 1].append(index)
+            elif remaining[index] == 0 and not exitDraw[index]: # every move is a capture into a lost ending
+                levels[exitLoss[index]].append(index)
+    for plies in range(MAX_PLIES + 1):
+        for index in levels[plies]:
+            if resolved[index]:
+                continue
+            resolved[index] = 1
+            values[index] = plies + 1
+            for predecessor in predecessors[predecessorOffsets[index]:predecessorOffsets[index + 1]]:
+                if resolved[predecessor]:
+                    continue
+                if plies % 2 == 0: # index loses, so moving there wins
+                    levels[plies + 1].append(predecessor)
+                else:
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor] == 0 and not exitDraw[predecessor] and exitWin[predecessor] == ILLEGAL:
+                        levels[max(plies + 1, exitLoss[predecessor])].append(predecessor)
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    generateParser = subparsers.add_parser("generate", help="generate tables, with the smaller ones they need")
+    generateParser.add_argument("signatures", nargs="+", help="material such as KQvK, KRvK, KPvK or KQvKR")
+    generateParser.add_argument("--dir", default="Chess/tablebases")
+    generateParser.add_argument("--workers", type=int, default=os.cpu_count())
+    probeParser = subparsers.add_parser("probe", help="look up a position")
+    probeParser.add_argument("fen")
+    probeParser.add_argument("--dir", default="Chess/tablebases")
+    args = parser.parse_args()
+    if args.mode == "generate":
+        with ProcessPoolExecutor(args.workers) as executor:
+            for signature in args.signatures:
+                generate(signature, args.dir, executor)
+    else:
+        tablebase = Tablebase(args.dir)
+        gs = GameState.fromFen(args.fen)
+        result = tablebase.probe(gs)
+        if result is None:
+            print("position not covered")
+        else:
+            move = tablebase.bestMove(gs)
+            print("%s in %d plies%s" % (result[0], result[1], ", best move " + move.getChessNotation() if move else ""))
+
+if __name__ == "__main__":
+    main()